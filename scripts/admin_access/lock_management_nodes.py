@@ -23,174 +23,382 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 """
-    Attempt to lock any management nodes that are not already locked in HSM.
+    Lock, unlock or report the lock status of components in HSM.  By default
+    any management nodes and their BMCs that are not already locked are
+    locked; selectors pick other nodes, such as the compute nodes in a
+    cabinet, for maintenance.
 """
 
 import json
-from base64 import b64decode
+import getopt
+import os
 import sys
-import requests
-from kubernetes import client, config
-
-def getK8sClient():
-    """Create a k8s client object for use in getting auth tokens."""
-    config.load_kube_config()
-    k8sClient = client.CoreV1Api()
-    return k8sClient
-
-def getAuthenticationToken():
-    """Fetch auth token for HMS REST API calls."""
-    URL = "https://api-gw-service-nmn.local/keycloak/realms/shasta/protocol/openid-connect/token"
-
-    kSecret = getK8sClient().read_namespaced_secret("admin-client-auth", "default")
-    secret = b64decode(kSecret.data['client-secret']).decode("utf-8")
-
-    DATA = {
-        "grant_type": "client_credentials",
-        "client_id": "admin-client",
-        "client_secret": secret
-    }
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode, quote
 
-    try:
-        r = requests.post(url=URL, data=DATA)
-    except OSError:
-        return ""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from csm_common import hmsclient
+from csm_common import snapshot
+from csm_common import timings
+from csm_common import xnames
+
+HSM_URL = "https://api-gw-service-nmn.local/apis/smd/hsm/v2"
+
+# Components per lock request, and lock requests made at once.  Keeping the
+# requests small bounds how long HSM holds its locks for each one, and sending
+# several at a time keeps the total time flat as the number of nodes grows.
+LOCK_CHUNK_SIZE = 100
+LOCK_WORKERS = 4
 
-    result = json.loads(r.text)
-    return result['access_token']
+ACTIONS = ["lock", "unlock", "status"]
 
-def doRest(uri, authToken, op, payload=None):
+class Selection():
     """
-        Func to get a JSON payload from a URL. It's assumed to be a full URL.
-        Also note that we'll only ever be contacting HMS services.
+        The components to act on, from the command line selectors.  HSM
+        filters the lock status by type, role and subrole; group membership
+        and xname prefixes are applied to what it returns.  With no selectors
+        at all this is the management nodes.
     """
-    getHeaders = {'Authorization': 'Bearer %s' % authToken,}
-    if op == "get":
-        r = requests.get(url=uri, headers=getHeaders)
-    elif op == "post" and not payload is None:
-        r = requests.post(url=uri, headers=getHeaders, data=json.dumps(payload))
-    else:
-        return 1
 
-    retJSON = r.text
+    def __init__(self, types=(), roles=(), subroles=(), groups=(), prefixes=(), bmcs=True):
+        self.default = not (types or roles or subroles or groups or prefixes)
+        self.types = list(types) or ["Node"]
+        self.roles = list(roles) or (["Management"] if self.default else [])
+        self.subroles = list(subroles)
+        self.groups = list(groups)
+        self.prefixes = list(prefixes)
+        # Also act on the BMCs of the selected nodes
+        self.bmcs = bmcs and "node" in [ctype.lower() for ctype in self.types]
+
+    def statusFilter(self):
+        """The HSM query string for the lock status of the selected types and roles."""
+        params = [("type", ctype) for ctype in self.types]
+        params += [("role", role) for role in self.roles]
+        params += [("subrole", subrole) for subrole in self.subroles]
+        return "?" + urlencode(params)
+
+    def describe(self):
+        """What the selected components are called in the summary."""
+        if self.default:
+            return "management nodes and BMCs"
+        return "components"
 
-    if r.status_code >= 300:
-        stat = 1
-    else:
-        stat = 0
+def doRestPost(hms, uri, payload):
+    """POST a payload to a URL as JSON"""
+    return hms.post(uri, json.dumps(payload))
 
-    return retJSON, stat
+def getLockStatus(hms, fltr, refresh=False):
+    """
+        Get the lock status of the components matching an HSM filter in one
+        query, as a dict of xname -> status (ID, Locked, Reserved and
+        ReservationDisabled) in the order HSM returned them.  With refresh
+        the snapshot is only read when replaying (see HMSClient.get()).
+    """
+    status = {}
+
+    def addStatus(comp):
+        status[comp['ID']] = comp
+
+    rstat = hms.stream(HSM_URL + "/locks/status" + fltr, addStatus, key='Components', refresh=refresh)
+    return status, rstat
+
+def getGroupMembers(hms, label, refresh=False):
+    """Get the xnames in an HSM group as a set."""
+    groupJSON, rstat = hms.get(HSM_URL + "/groups/" + quote(label), refresh=refresh)
+    if rstat != 0:
+        return set(), rstat
+    return set(json.loads(groupJSON).get('members', {}).get('ids') or []), 0
+
+def selectComponents(hms, selection, refresh=False):
+    """
+        Get the lock status of the selected components.  The lock status
+        queries and group lookups don't depend on each other, so they're made
+        at the same time.  Returns a dict of xname -> status, nodes first then
+        BMCs, and a status that is non-zero on failure.  With refresh
+        nothing is read from the snapshot unless replaying.
+    """
+    with ThreadPoolExecutor(max_workers=LOCK_WORKERS) as executor:
+        statusFuture = executor.submit(getLockStatus, hms, selection.statusFilter(), refresh)
+        bmcFuture = None
+        if selection.bmcs:
+            bmcFuture = executor.submit(getLockStatus, hms, "?type=NodeBMC", refresh)
+        groupFutures = [(label, executor.submit(getGroupMembers, hms, label, refresh))
+                        for label in selection.groups]
 
-def doRestGet(uri, authToken):
-    """Wrapper for doRest() for GET operations"""
-    return doRest(uri, authToken, "get")
+        compStatus, stat = statusFuture.result()
+        if stat != 0:
+            print("HSM lock status returned non-zero.")
+            return {}, stat
+        members = None
+        for label, future in groupFutures:
+            ids, stat = future.result()
+            if stat != 0:
+                print("HSM group '%s' returned non-zero." % label)
+                return {}, stat
+            members = ids if members is None else members | ids
+        bmcStatus = {}
+        if bmcFuture is not None:
+            bmcStatus, stat = bmcFuture.result()
+            if stat != 0:
+                print("HSM lock status returned non-zero.")
+                return {}, stat
 
-def doRestPost(uri, authToken, payload):
-    """Wrapper for doRest() for POST operations"""
-    return doRest(uri, authToken, "post", payload)
+    selected = {}
+    for xname, status in compStatus.items():
+        if members is not None and xname not in members:
+            continue
+        if selection.prefixes and not any(xnames.isWithin(xname, prefix) for prefix in selection.prefixes):
+            continue
+        selected[xname] = status
 
-def getHSMComps(authToken, fltr):
-    """Get HSM RFEP data"""
-    url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/State/Components" + fltr
-    rfepJSON, rstat = doRestGet(url, authToken)
-    rfepData = json.loads(rfepJSON)
-    return rfepData, rstat
+    # The lock status of every NodeBMC is one small query however many nodes
+    # there are, where asking for each BMC by ID would put them all in the URL.
+    if bmcStatus:
+        bmcs = set(xnames.parent(xname) for xname in selected)
+        for xname, status in bmcStatus.items():
+            if xname in bmcs:
+                selected[xname] = status
+    return selected, 0
 
-def doHSMLock(authToken, compIDList):
-    """Lock specified components. compIDStr is a comma separated list of components to lock"""
-    url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/locks/lock"
+def doHSMLock(hms, compIDList, action="lock"):
+    """Lock or unlock specified components. compIDList is a list of xnames"""
+    url = HSM_URL + "/locks/" + action
     payload = {"ComponentIDs": compIDList, "ProcessingModel": "flexible"}
-    respJSON, rstat = doRestPost(url, authToken, payload)
-    respData = json.loads(respJSON)
+    respJSON, rstat = doRestPost(hms, url, payload)
+    try:
+        respData = json.loads(respJSON)
+    except ValueError:
+        respData = {}
     return respData, rstat
 
-def genIDStr(compList):
-    """Turn a list of components into a list of xnames."""
-    compStr = ""
-    for comp in compList:
-        if len(compStr) > 0:
-            compStr += "," + comp['ID']
-        else:
-            compStr += comp['ID']
-    return compStr
+def chunks(items, size):
+    """Split a list into lists of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def mergeLockResults(results, action="lock"):
+    """
+        Merge the (response, status) of each doHSMLock() chunk into one
+        response.  Every component of a chunk whose request failed is counted
+        as a failure, with HSM's error as the reason.
+    """
+    merged = {
+        'Counts': {'Total': 0, 'Success': 0, 'Failure': 0},
+        'Success': {'ComponentIDs': []},
+        'Failure': [],
+    }
+    for compIDList, (respData, rstat) in results:
+        if rstat != 0:
+            reason = respData.get('detail', "%s request failed" % action)
+            merged['Failure'].extend({'ID': compID, 'Reason': reason} for compID in compIDList)
+            continue
+        merged['Success']['ComponentIDs'].extend(respData.get('Success', {}).get('ComponentIDs') or [])
+        merged['Failure'].extend(respData.get('Failure') or [])
+
+    merged['Counts']['Success'] = len(merged['Success']['ComponentIDs'])
+    merged['Counts']['Failure'] = len(merged['Failure'])
+    merged['Counts']['Total'] = merged['Counts']['Success'] + merged['Counts']['Failure']
+    return merged
+
+def lockComponents(hms, compIDList, action="lock", chunkSize=LOCK_CHUNK_SIZE, workers=LOCK_WORKERS):
+    """
+        Lock or unlock components, chunkSize at a time with up to workers
+        requests at once, and return the merged result (see
+        mergeLockResults()).  A line is printed as each batch finishes with
+        its results and how long it took.
+    """
+    batches = chunks(compIDList, chunkSize)
 
-def genSummary(compList, compLockList, lockRet):
-    """Generate a summary of management nodes locked and any errors that occurred."""
+    def runBatch(batch):
+        start = time.perf_counter()
+        result = doHSMLock(hms, batch, action)
+        return result, time.perf_counter() - start
+
+    results = [None] * len(batches)
+    done = 0
+    doneComps = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(runBatch, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i], elapsed = future.result()
+            done += 1
+            doneComps += len(batches[i])
+            batchRet = mergeLockResults([(batches[i], results[i])], action)
+            print("Batch %d/%d: %d %sed, %d failed in %.2fs (%d of %d components done)" %
+                  (done, len(batches), batchRet['Counts']['Success'], action, batchRet['Counts']['Failure'],
+                   elapsed, doneComps, len(compIDList)))
+            sys.stdout.flush()
+    return mergeLockResults(zip(batches, results), action)
+
+def genSummary(compList, compLockList, lockRet, action="lock", what="management nodes and BMCs"):
+    """Generate a summary of components locked or unlocked and any errors that occurred."""
     print("Operation Summary")
     print("=================")
 
-    print("Found %d management nodes and BMCs:" % (len(compList)))
+    print("Found %d %s:" % (len(compList), what))
     print("    " + ','.join(compList))
 
-    print("Found %d management nodes and BMCs to lock:" % (len(compLockList)))
+    print("Found %d %s to %s:" % (len(compLockList), what, action))
     print("    " + ','.join(compLockList))
 
     if lockRet['Counts']['Success'] > 0:
-        print("Successfully locked %d management nodes and BMCs:" % (lockRet['Counts']['Success']))
+        print("Successfully %sed %d %s:" % (action, lockRet['Counts']['Success'], what))
         compStr = ','.join(lockRet['Success']['ComponentIDs'])
         print("    " + compStr)
 
     if lockRet['Counts']['Failure'] > 0:
-        print("Failed to lock %d management nodes and BMCs:" % (lockRet['Counts']['Failure']))
+        print("Failed to %s %d %s:" % (action, lockRet['Counts']['Failure'], what))
         for comp in lockRet['Failure']:
             print("    " + comp['ID'] + " - " + comp['Reason'])
 
     print("")
     return lockRet['Counts']['Failure']
 
+def printStatus(compStatus):
+    """Print the lock status of each component and the totals."""
+    print("%-20s %-7s %-9s %s" % ("Component", "Locked", "Reserved", "ReservationDisabled"))
+    locked = 0
+    for xname, status in compStatus.items():
+        print("%-20s %-7s %-9s %s" % (xname, status.get('Locked', False), status.get('Reserved', False),
+                                      status.get('ReservationDisabled', False)))
+        if status.get('Locked', False):
+            locked += 1
+    print("")
+    print("%d components, %d locked, %d unlocked" % (len(compStatus), locked, len(compStatus) - locked))
+
+def usage():
+    print("Usage: %s [options]" % sys.argv[0])
+    print(" ")
+    print("With no selectors, the management nodes and their BMCs are selected.")
+    print(" ")
+    print("   --action=action       lock (the default), unlock or status.")
+    print("   --type=list           Comma-separated HSM component types to select")
+    print("                         (default Node).")
+    print("   --role=list           Comma-separated HSM roles to select, for example")
+    print("                         Management or Compute.")
+    print("   --subrole=list        Comma-separated HSM subroles to select, for")
+    print("                         example Master, Worker or Storage.")
+    print("   --group=list          Comma-separated HSM groups; only their members")
+    print("                         are selected.")
+    print("   --xname=list          Comma-separated XName patterns; only components")
+    print("                         at or below one of them are selected.  Matching")
+    print("                         is by whole XName elements, so x100 does not")
+    print("                         match x1000.  Example: x1000,x3000c0s7")
+    print("   --no-bmcs             Don't act on the BMCs of the selected nodes.")
+    print("   --batch-size=N        Components per lock request (default %d)." % LOCK_CHUNK_SIZE)
+    print("   --workers=N           Lock requests made at once (default %d)." % LOCK_WORKERS)
+    print(snapshot.USAGE)
+    print("                         Reports what would be locked without locking.")
+    print("                         Lock and unlock always read the lock state from")
+    print("                         HSM; only --action=status uses --snapshot-cache.")
+    print(timings.USAGE)
+    print(" ")
+
 def errorGuidance():
     print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/hardware_state_manager/Lock_and_Unlock_Management_Nodes.md\n")
 
 def main():
     """Entry point"""
+
     numErrs = 0
-    compList = []
-    compLockList = []
-    bmcList = []
-    authToken = getAuthenticationToken()
-    if authToken == "":
-        print("ERROR: No/empty auth token, can't continue.")
-        print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md\n")
+    action = "lock"
+    selectors = {}
+    bmcs = True
+    chunkSize = LOCK_CHUNK_SIZE
+    workers = LOCK_WORKERS
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "action=", "type=", "role=", "subrole=", "group=",
+                                                       "xname=", "no-bmcs", "batch-size=", "workers="] +
+                                   snapshot.LONG_OPTS + timings.LONG_OPTS)
+    except getopt.GetoptError:
+        usage()
         return 1
 
-    compData, stat = getHSMComps(authToken, "?type=node&role=management")
-    if stat != 0:
-        print("HSM Components returned non-zero.")
-        errorGuidance()
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+        elif opt == "--action":
+            action = arg
+            if action not in ACTIONS:
+                print("ERROR: Invalid --action: '%s'" % arg)
+                return 1
+        elif opt in ("--type", "--role", "--subrole", "--group", "--xname"):
+            selectors[opt[2:]] = [item for item in arg.split(',') if item]
+        elif opt == "--no-bmcs":
+            bmcs = False
+        elif opt in ("--batch-size", "--workers"):
+            try:
+                value = int(arg)
+            except ValueError:
+                value = 0
+            if value < 1:
+                print("ERROR: Invalid %s: '%s'" % (opt, arg))
+                return 1
+            if opt == "--batch-size":
+                chunkSize = value
+            else:
+                workers = value
+
+    for pattern in selectors.get("xname", []):
+        if xnames.parse(pattern) is None:
+            print("ERROR: Invalid XName pattern: '%s'" % pattern)
+            return 1
+    selection = Selection(types=selectors.get("type", ()), roles=selectors.get("role", ()),
+                          subroles=selectors.get("subrole", ()), groups=selectors.get("group", ()),
+                          prefixes=selectors.get("xname", ()), bmcs=bmcs)
+    what = selection.describe()
+
+    try:
+        dataSnapshot = snapshot.fromOpts(opts)
+    except ValueError as err:
+        print("ERROR: %s" % err)
         return 1
-    for comp in compData['Components']:
-        compList.append(comp['ID'])
-        fields = comp['ID'].split('n')
-        bmcList.append(fields[0])
-        if "Locked" in comp and comp['Locked'] is True:
-            continue
-        compLockList.append(comp['ID'])
-    if len(compLockList) == 0 and len(bmcList) == 0:
-        print("No Management Nodes to Lock")
-        return 0
-    compData, stat = getHSMComps(authToken, "?type=nodebmc&id=" + '&id='.join(bmcList))
+    timer = timings.fromOpts(opts)
+    hms = hmsclient.HMSClient(dataSnapshot, timings=timer)
+    replay = hms.replay
+
+    if not replay:
+        with timer.phase("auth"):
+            token = hms.authenticate()
+        if token == "":
+            print("ERROR: No/empty auth token, can't continue.")
+            print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md\n")
+            return 1
+
+    # What to lock or unlock is always decided from live lock state; only a
+    # status report can use a cached snapshot.
+    with timer.phase("fetch"):
+        compStatus, stat = selectComponents(hms, selection, refresh=(action != "status"))
     if stat != 0:
-        print("HSM Components returned non-zero.")
         errorGuidance()
         return 1
-    for comp in compData['Components']:
-        compList.append(comp['ID'])
-        if "Locked" in comp and comp['Locked'] is True:
-            continue
-        compLockList.append(comp['ID'])
-    if len(compLockList) == 0:
-        print("No Management Nodes to Lock")
+
+    if action == "status":
+        printStatus(compStatus)
         return 0
-    retData, stat = doHSMLock(authToken, compLockList)
-    if stat != 0:
-        if "detail" in retData:
-            print("Failed to lock Management Nodes: " + retData['detail'])
+
+    # Lock the components that aren't locked, or unlock those that are
+    compList = list(compStatus)
+    compLockList = [xname for xname, status in compStatus.items()
+                    if bool(status.get('Locked', False)) == (action == "unlock")]
+    if len(compLockList) == 0:
+        if selection.default and action == "lock":
+            print("No Management Nodes to Lock")
         else:
-            print("Failed to lock Management Nodes.")
-        errorGuidance()
-        return 1
+            print("No %s to %s" % (what, action))
+        return 0
+    if replay:
+        print("Replaying snapshot %s, not %sing." % (dataSnapshot.path, action))
+        print("Found %d %s to %s:" % (len(compLockList), what, action))
+        print("    " + ','.join(compLockList))
+        return 0
+    with timer.phase(action):
+        retData = lockComponents(hms, compLockList, action, chunkSize, workers)
 
-    numErrs = genSummary(compList, compLockList, retData)
+    numErrs = genSummary(compList, compLockList, retData, action, what)
 
     if numErrs > 0:
         errorGuidance()
@@ -24,94 +24,91 @@
 
 
 import sys,getopt
+import os
 import json
-from base64 import b64decode
-import requests
-from kubernetes import client, config
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from csm_common.records import HSMComponent
+from csm_common import hmsclient
+from csm_common import snapshot
+from csm_common import timings
+from csm_common import xnames
 
 dryrun = False
 debugLevel = 0
 
 
-# Create a k8s client object for use in getting auth tokens.
+# Func to get a JSON payload from a URL, or POST one to it.  It's assumed to
+# be a full URL.  Also note that we'll only ever be contacting HMS services.
 
-def getK8sClient():
-	config.load_kube_config()
-	k8sClient = client.CoreV1Api()
-	return k8sClient
+def doRest(hms, uri, postPayload=None):
+	global dryrun
+	global debugLevel
 
+	if not postPayload:
+		# GET
+		return hms.get(uri)
 
-# Fetch auth token for HMS REST API calls.
+	# POST
+	if debugLevel > 2:
+		print("URL: '%s', payload: '%s'" % (uri,postPayload))
 
-def getAuthenticationToken():
-	URL = "https://api-gw-service-nmn.local/keycloak/realms/shasta/protocol/openid-connect/token"
+	if dryrun == True:
+		fakeret = {'Targets': [{'Xname':'all','StatusCode':200,'StatusMsg': 'OK'}]
+		}
+		return json.dumps(fakeret), 0
 
-	kSecret = getK8sClient().read_namespaced_secret("admin-client-auth", "default")
-	secret = b64decode(kSecret.data['client-secret']).decode("utf-8")
+	return hms.post(uri, postPayload)
 
-	DATA = {
-		"grant_type": "client_credentials",
-		"client_id": "admin-client",
-		"client_secret": secret
-	}
 
-	try:
-		r = requests.post(url=URL, data=DATA)
-	except OSError:
-		return ""
+HSM_URL = "https://api-gw-service-nmn.local/apis/smd/hsm/v2"
 
-	result = json.loads(r.text)
-	return result['access_token']
+# HSM queries for the BMCs SSH keys can be set on (see selectBMCs()), so only
+# those are fetched.  HSM ANDs different filters together, hence one query
+# per class.
 
+BMC_FILTERS = [
+	"?type=ChassisBMC&type=NodeBMC&type=RouterBMC&class=Mountain&class=Hill",
+	"?type=RouterBMC&class=River",
+]
+RFEP_FILTER = "?type=ChassisBMC&type=NodeBMC&type=RouterBMC"
 
-# Func to get a JSON payload from a URL.  It's assumed to be a full URL.
-# Also note that we'll only ever be contacting HMS services.
+# Fetch the candidate BMCs from HSM, as a list of HSMComponent records.  With
+# include patterns only the components below each pattern are queried.
 
-def doRest(uri, authToken, postPayload=None):
-	global dryrun
-	global debugLevel
-
-	if not postPayload:
-		# GET
-		hdrs = {'Authorization': 'Bearer %s' % authToken,}
-		r = requests.get(url=uri, headers=hdrs)
+def getHSMComponents(hms, includes=()):
+	if includes:
+		roots = ["/State/Components/Query/" + incl for incl in includes]
 	else:
-		# POST
-		hdrs = {'Authorization': 'Bearer %s' % authToken, 'Content-Type': 'application/json',}
-		if debugLevel > 2:
-			print("URL: '%s', headers: '%s', payload: '%s'" % (uri,hdrs,postPayload))
-
-		if dryrun == False:
-			r = requests.post(url=uri, headers=hdrs, data=postPayload)
-		else:
-			fakeret = {'Targets': [{'Xname':'all','StatusCode':200,'StatusMsg': 'OK'}]
-			}
-			return json.dumps(fakeret), 0
+		roots = ["/State/Components"]
 
-	retJSON = r.text
+	comps = []
+	seen = set()
 
-	if r.status_code >= 300:
-		ret = 1
-	else:
-		ret = 0
-
-	return retJSON, ret
+	def addComponent(component):
+		# Overlapping include patterns return some components twice
+		if component['ID'] not in seen:
+			seen.add(component['ID'])
+			comps.append(HSMComponent.fromJSON(component))
 
+	for root in roots:
+		for fltr in BMC_FILTERS:
+			rstat = hms.stream(HSM_URL + root + fltr, addComponent, key='Components')
+			if rstat != 0:
+				return comps, rstat
+	return comps, 0
 
-# Fetch all components in HSM
 
-def getHSMComponents(authToken):
-	url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/State/Components"
-	compsJSON, rstat = doRest(url, authToken)
-	return compsJSON, rstat
+# Get the IDs of the BMC RF endpoints from HSM.
 
+def getHSMRFEPs(hms):
+	rfepIDs = set()
 
-# Get RF endpoints from HSM.
+	def addRFEP(rfep):
+		rfepIDs.add(rfep['ID'])
 
-def getHSMRFEPs(authToken):
-	url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/RedfishEndpoints"
-	rfepsJSON, rstat = doRest(url, authToken)
-	return rfepsJSON, rstat
+	rstat = hms.stream(HSM_URL + "/Inventory/RedfishEndpoints" + RFEP_FILTER, addRFEP, key='RedfishEndpoints')
+	return rfepIDs, rstat
 
 
 # Get the root SSH public key.
@@ -134,6 +131,73 @@ def getRootSSHKey():
 	return data
 
 
+# Select the BMCs to set SSH keys on: mountain/hill ChassisBMCs, NodeBMCs and
+# RouterBMCs, and river RouterBMCs, that pass the include/exclude patterns and
+# have an RF endpoint.
+
+def selectBMCs(comps, rfepIDs, includes, excludes):
+	global debugLevel
+
+	ids = []
+
+	for comp in comps:
+		if debugLevel > 2:
+			print("COMP: .%s." % comp)
+
+		if len(excludes) > 0:
+			skip = False
+			for excl in excludes:
+				if xnames.isWithin(comp.xname, excl):
+					skip = True
+					break
+			if skip == True:
+				continue
+
+		if len(includes) > 0:
+			skip = True
+			for incl in includes:
+				if xnames.isWithin(comp.xname, incl):
+					skip = False
+					break
+			if skip == True:
+				continue
+				
+		lcmp = None
+		tclass = None
+
+		# Some components have no class at all.  Rubes!  Try to infer it.
+
+		if comp.xclass is not None:
+			tclass = comp.xclass
+		else:
+			if comp.type == "CabinetPDUController" or comp.type == "CabinetPDUPowerConnector":
+				tclass = "River"
+			else:
+				if debugLevel > 2:
+					print("WARNING: component with no class, ignoring: '%s', type: '%s'" % (comp.xname,comp.type))
+				continue
+
+
+		if tclass == "Mountain" or tclass == "Hill":
+			if comp.type == "ChassisBMC" or comp.type == "NodeBMC" or comp.type == "RouterBMC":
+				lcmp = comp.xname
+		else:
+			if comp.type == "RouterBMC":
+				lcmp = comp.xname
+
+		if not lcmp == None:
+			if debugLevel > 2:
+				print("MATCHED: '%s'" % lcmp)
+
+			# Make sure there is an RFEP for it
+			if lcmp not in rfepIDs:
+				print("WARNING: RF endpoint for '%s' not found, ignoring." % lcmp)
+			else:
+				ids.append(lcmp)
+
+	return ids
+
+
 # Print usage info
 
 def usage():
@@ -144,6 +208,8 @@ def usage():
 	print("   --exclude=list   Comma-separated list of target patterns to exclude.")
 	print("                    Each item in the list is matched on the front")
 	print("                    of each target XName and excluded if there is a match.")
+	print("                    Matching is by whole XName elements, so x100 does")
+	print("                    not match x1000.")
 	print("                    Example: x1000,x3000c0,x9000c1s0")
 	print("                        This will exclude all BMCs in cabinet x1000,")
 	print("                        all BMCs at or below x3000c0, and all BMCs")
@@ -155,6 +221,9 @@ def usage():
 	print("                    NOTE: --include and --exclude are mutually exclusive.")
 	print("   --sshkey=key     SSH key to set on BMCs.  If none is specified, will use")
 	print("                    the root account SSH public key.")
+	print(snapshot.USAGE)
+	print("                         Implies --dryrun.")
+	print(timings.USAGE)
 	print(" ")
 
 def errorGuidance():
@@ -176,7 +245,7 @@ def main():
 	includes = []
 
 	try:
-		opts,args = getopt.getopt(sys.argv[1:],"",["exclude=","include=","debug=","dryrun","sshkey="])
+		opts,args = getopt.getopt(sys.argv[1:],"",["exclude=","include=","debug=","dryrun","sshkey="] + snapshot.LONG_OPTS + timings.LONG_OPTS)
 	except getopt.GetoptError:
 		usage()
 		return 1
@@ -200,25 +269,45 @@ def main():
 		print("ERROR: Can't use both --exclude and --include.")
 		return 1
 
+	try:
+		dataSnapshot = snapshot.fromOpts(opts)
+	except ValueError as err:
+		print("ERROR: %s" % err)
+		return 1
+	timer = timings.fromOpts(opts)
+	hms = hmsclient.HMSClient(dataSnapshot, timings=timer)
+
+	# Replaying a snapshot never touches the BMCs.
+	replay = hms.replay
+	if replay:
+		dryrun = True
+
 	if not includeList == None:
 		includes = includeList.split(',',-1)
 
 	if not excludeList == None:
 		excludes = excludeList.split(',',-1)
 
+	for pattern in includes + excludes:
+		if xnames.parse(pattern) is None:
+			print("ERROR: Invalid XName pattern: '%s'" % pattern)
+			return 1
+
 	if debugLevel > 0:
 		print("Excludes: .%s." % excludes)
 		print("Includes: .%s." % includes)
 
-	authToken = getAuthenticationToken()
-	if authToken == "":
-		print("ERROR: No/empty auth token, can't continue.")
-		print(" ")
-		print("For troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md.")
-		print(" ")
-		return 1
+	if not replay:
+		with timer.phase("auth"):
+			token = hms.authenticate()
+		if token == "":
+			print("ERROR: No/empty auth token, can't continue.")
+			print(" ")
+			print("For troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md.")
+			print(" ")
+			return 1
 
-	if not rootSSHKey:
+	if not rootSSHKey and not replay:
 		rootSSHKey = getRootSSHKey()
 		if not rootSSHKey:
 			print("ERROR: Can't get root SSH key.")
@@ -229,13 +318,15 @@ def main():
 	# Get this info from the State/Components API in HSM.  Also get RF 
 	# endpoint info.
 
-	compRaw,stat = getHSMComponents(authToken)
+	with timer.phase("fetch components"):
+		comps,stat = getHSMComponents(hms, includes)
 	if stat != 0:
 		print("HSM Component fetch returned non-zero.")
 		errorGuidance()
 		return 1
 
-	rfepRaw,stat = getHSMRFEPs(authToken)
+	with timer.phase("fetch RedfishEndpoints"):
+		rfepIDs,stat = getHSMRFEPs(hms)
 	if stat != 0:
 		print("HSM RF Endpoint fetch returned non-zero.")
 		errorGuidance()
@@ -243,68 +334,8 @@ def main():
 
 	# Generate a JSON payload for SCSD.
 
-	compJSON = json.loads(compRaw)
-	rfepJSON = json.loads(rfepRaw)
-	ids = []
-
-	# First get a list of mountain/hill BMCs.  Make sure there is an RFEP for
-	# each one or it won't be valid.
-
-	for comp in compJSON['Components']:
-		if debugLevel > 2:
-			print("COMP: .%s." % comp)
-
-		if len(excludes) > 0:
-			skip = False
-			for excl in excludes:
-				if comp['ID'].startswith(excl):
-					skip = True
-					break
-			if skip == True:
-				continue
-
-		if len(includes) > 0:
-			skip = True
-			for incl in includes:
-				if comp['ID'].startswith(incl):
-					skip = False
-					break
-			if skip == True:
-				continue
-				
-		lcmp = None
-		tclass = None
-
-		# Some components have no class at all.  Rubes!  Try to infer it.
-
-		if "Class" in comp:
-			tclass = comp['Class']
-		else:
-			if comp['Type'] == "CabinetPDUController" or comp['Type'] == "CabinetPDUPowerConnector":
-				tclass = "River"
-			else:
-				if debugLevel > 2:
-					print("WARNING: component with no class, ignoring: '%s', type: '%s'" % (comp['ID'],comp['Type']))
-				continue
-
-
-		if tclass == "Mountain" or tclass == "Hill":
-			if comp['Type'] == "ChassisBMC" or comp['Type'] == "NodeBMC" or comp['Type'] == "RouterBMC":
-				lcmp = comp['ID']
-		else:
-			if comp['Type'] == "RouterBMC":
-				lcmp = comp['ID']
-
-		if not lcmp == None:
-			if debugLevel > 2:
-				print("MATCHED: '%s'" % lcmp)
-
-			# Get FQDN from RFEP data
-			lf = list(filter(lambda rfid: rfid['ID'] == lcmp, rfepJSON['RedfishEndpoints']))
-			if len(lf) == 0:
-				print("WARNING: RF endpoint for '%s' not found, ignoring." % lcmp)
-			else:
-				ids.append(lcmp)
+	with timer.phase("select"):
+		ids = selectBMCs(comps, rfepIDs, includes, excludes)
 
 	if len(ids) == 0:
 		print("No mountain-class BMCs found, nothing to do.")
@@ -314,14 +345,15 @@ def main():
 
 	pld = {
 		'Targets': ids,
-		'Params': {'SSHKey': rootSSHKey.rstrip()}
+		'Params': {'SSHKey': (rootSSHKey or "").rstrip()}
 	}
 
 	# Use SCSD to set SSH keys on all of these controllers.   Create a JSON 
 	# payload to cover all of them and use the /bmc/globalcreds API.
 
 	url = "https://api_gw_service.local/apis/scsd/v1/bmc/loadcfg"
-	rfepJSON, rstat = doRest(url, authToken, json.dumps(pld))
+	with timer.phase("set keys"):
+		rfepJSON, rstat = doRest(hms, url, json.dumps(pld))
 
 	# Check the returned JSON payload to see if any targets failed, and if so,
 	# report them.  Any error results in a script failure.
@@ -0,0 +1,378 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Client for the HMS services (HSM, SLS, SCSD, ...) behind the API gateway.
+
+    All requests a script makes go over one requests.Session, so connections
+    to the gateway are kept alive and reused instead of paying for a new TCP
+    connection and TLS handshake on every call.  Idempotent requests are
+    retried with backoff on connection errors and gateway errors.  GETs can
+    be served from, and saved to, a snapshot (see snapshot.py).
+
+    requests and kubernetes take a good part of a second to import, so they're
+    only imported when the first request is made or a secret is read.  Scripts
+    can import this module at the top without slowing down -h, bad arguments
+    or runs that replay a snapshot.
+"""
+
+import codecs
+import json
+import re
+import sys
+import threading
+import time
+from base64 import b64decode
+
+from csm_common import snapshot
+from csm_common import timings as run_timings
+from csm_common import tokencache
+
+API_GATEWAY = "https://api-gw-service-nmn.local"
+TOKEN_URL = API_GATEWAY + "/keycloak/realms/shasta/protocol/openid-connect/token"
+
+# Connections kept alive per host.  Enough for the scripts that fan requests
+# out over a thread pool.
+POOL_SIZE = 16
+
+# Retries for connection errors and for the gateway or a service being
+# briefly unavailable, waiting 0.5s, 1s, 2s between attempts.  Only
+# idempotent methods are retried, never POST.  These are urllib3 Retry
+# arguments.
+RETRY = dict(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], raise_on_status=False)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def getK8sClient():
+    """Create a k8s client object for use in getting auth tokens."""
+    # Note, version on v1.3 systems throws a warning in stderr
+    from kubernetes import client, config
+    config.load_kube_config()
+    return client.CoreV1Api()
+
+def getClientSecret():
+    """Get the Keycloak admin client secret from Kubernetes."""
+    kSecret = getK8sClient().read_namespaced_secret("admin-client-auth", "default")
+    return b64decode(kSecret.data['client-secret']).decode("utf-8")
+
+json_decoder = json.JSONDecoder()
+json_separator_regex = re.compile(r"[\s,]*")
+
+def iterJSONArray(chunks, key=None):
+    """
+        Incrementally parse a JSON array out of a stream of raw response
+        chunks, yielding the array elements one at a time as they are read.
+        If key is given the array is the value of that key in the top level
+        object, otherwise the top level value is the array itself.  Only the
+        unparsed tail of the response is ever held in memory.
+    """
+    if key is None:
+        array_start_regex = re.compile(r"\s*\[")
+    else:
+        array_start_regex = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def readMore():
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buf = buf[pos:] + decoder.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + decoder.decode(chunk)
+        pos = 0
+
+    # Find the start of the array
+    while True:
+        match = array_start_regex.search(buf) if key else array_start_regex.match(buf)
+        if match is not None:
+            pos = match.end()
+            break
+        if eof:
+            raise ValueError("JSON array %snot found in response" % ("'%s' " % key if key else ""))
+        readMore()
+
+    # Parse the array elements
+    while True:
+        pos = json_separator_regex.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+
+        try:
+            element, end = json_decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            readMore()
+            continue
+
+        # Make sure a scalar wasn't cut off at the end of the buffer
+        if end == len(buf) and not eof:
+            readMore()
+            continue
+
+        pos = end
+        yield element
+
+class HMSClient():
+    """
+        A session with the HMS services.  Call authenticate() to get a token
+        before making requests, unless everything is replayed from a
+        snapshot.  Safe to share between threads.
+
+        The token is cached between runs if HMS_TOKEN_CACHE is set (see
+        tokencache.py).  A request rejected with 401 gets a new token and is
+        retried once, which covers both a cached token that was revoked and a
+        token that expired during a long run.
+
+        Every request is recorded in timings, if given (see timings.py).
+    """
+
+    def __init__(self, dataSnapshot=None, pool_size=POOL_SIZE, verify=True, tokenCache=None, timings=None):
+        self.snapshot = dataSnapshot
+        self.timings = timings if timings is not None else run_timings.Timings()
+        self.verify = verify
+        self.authToken = ""
+        self.tokenCache = tokenCache if tokenCache is not None else tokencache.fromEnv()
+        self.authLock = threading.Lock()
+
+        self.poolSize = pool_size
+        self.sessionLock = threading.Lock()
+        self._session = None
+
+    @property
+    def session(self):
+        """
+            The requests.Session, created on first use so that runs replaying a
+            snapshot never import requests.
+        """
+        with self.sessionLock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize,
+                                      max_retries=Retry(**RETRY))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                # requests asks for this by default, be explicit since the big
+                # HSM and SLS responses compress very well.
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                self._session = session
+            return self._session
+
+    @property
+    def replay(self):
+        """True if all data comes from a snapshot, no API calls are made."""
+        return self.snapshot is not None and self.snapshot.replay
+
+    def authenticate(self, refresh=False):
+        """
+            Get an auth token for HMS REST API calls, from the token cache if
+            there is one or else from Keycloak.  refresh skips the cache.
+            Returns the token, or "" if one couldn't be had.
+        """
+        if self.tokenCache is not None and not refresh:
+            token = self.tokenCache.load()
+            if token is not None:
+                self.authToken = token
+                return self.authToken
+
+        start = time.perf_counter()
+        secret = getClientSecret()
+        self.timings.addRequest("GET", "secret default/admin-client-auth", "k8s",
+                                time.perf_counter() - start)
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": "admin-client",
+            "client_secret": secret
+        }
+
+        try:
+            start = time.perf_counter()
+            r = self.session.post(url=TOKEN_URL, data=data, verify=self.verify)
+            self.recordResponse("POST", TOKEN_URL, r, start)
+            reply = r.json()
+            self.authToken = reply['access_token']
+        except (OSError, ValueError, KeyError):
+            self.authToken = ""
+            return self.authToken
+
+        if self.tokenCache is not None:
+            try:
+                self.tokenCache.save(self.authToken, float(reply.get('expires_in', 0)))
+            except (OSError, ValueError, TypeError) as err:
+                print("WARNING: Could not save token cache %s: %s" % (self.tokenCache.path, err), file=sys.stderr)
+
+        return self.authToken
+
+    def refreshToken(self, rejected):
+        """
+            Get a new token after the token rejected got a 401.  If another
+            thread already replaced it, that token is used instead.
+        """
+        with self.authLock:
+            if self.authToken == rejected:
+                if self.tokenCache is not None:
+                    self.tokenCache.clear()
+                self.authenticate(refresh=True)
+            return self.authToken
+
+    def request(self, method, uri, **kwargs):
+        """
+            Make an authenticated request, returning the requests.Response.
+            On a 401 the token is refreshed and the request retried once.
+        """
+        token = self.authToken
+        headers = {'Authorization': 'Bearer %s' % token}
+        headers.update(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("verify", self.verify)
+        r = self.session.request(method, uri, headers=headers, **kwargs)
+
+        if r.status_code == 401 and not self.replay:
+            rejected = token
+            token = self.refreshToken(rejected)
+            if token and token != rejected:
+                r.close()
+                headers['Authorization'] = 'Bearer %s' % token
+                r = self.session.request(method, uri, headers=headers, **kwargs)
+        return r
+
+    def recordResponse(self, method, uri, r, start):
+        """Record a request whose body has been read in full in the timings."""
+        if self.timings.enabled:
+            self.timings.addRequest(method, uri, r.status_code, time.perf_counter() - start,
+                                    wait=r.elapsed.total_seconds(), size=len(r.content))
+
+    def get(self, uri, useSnapshot=True, refresh=False):
+        """
+            GET a URL, returning the response text and a status that is
+            non-zero on failure.  The snapshot, if any, is used unless
+            useSnapshot is False.  With refresh, cached data is only used
+            when replaying; otherwise the URL is fetched and the snapshot
+            updated with it.
+        """
+        start = time.perf_counter()
+        snap = self.snapshot if useSnapshot else None
+        if snap is not None and (snap.replay or not refresh):
+            text = snap.load(uri)
+            if text is not None:
+                self.timings.addRequest("GET", uri, None, time.perf_counter() - start, size=len(text))
+                return text, 0
+            if snap.replay:
+                snap.missing(uri)
+                return "", 1
+
+        r = self.request("GET", uri)
+        self.recordResponse("GET", uri, r, start)
+        if r.status_code >= 300:
+            return r.text, 1
+
+        if snap is not None:
+            snap.store(uri, r.text)
+        return r.text, 0
+
+    def stream(self, uri, handler, key=None, useSnapshot=True, refresh=False):
+        """
+            GET a URL returning a JSON array and call handler on each element
+            of the array as it's read (see iterJSONArray()).  Returns a status
+            that is non-zero on failure.  useSnapshot and refresh are as for
+            get().
+        """
+        start = time.perf_counter()
+        snap = self.snapshot if useSnapshot else None
+        if snap is not None and (snap.replay or not refresh):
+            f = snap.open(uri)
+            if f is not None:
+                with f:
+                    chunks = run_timings.ReadCounter(snapshot.readChunks(f, STREAM_CHUNK_SIZE))
+                    for element in iterJSONArray(chunks, key):
+                        handler(element)
+                self.recordStream(uri, None, start, None, chunks)
+                return 0
+
+            if snap.replay:
+                snap.missing(uri)
+                return 1
+
+        with self.request("GET", uri, stream=True) as r:
+            if r.status_code >= 300:
+                self.recordResponse("GET", uri, r, start)
+                return 1
+
+            chunks = run_timings.ReadCounter(r.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+            body = chunks
+            if snap is not None:
+                body = snap.save(uri, chunks)
+
+            for element in iterJSONArray(body, key):
+                handler(element)
+
+            # Read anything left after the array so a snapshot gets the whole body
+            for _ in body:
+                pass
+
+        self.recordStream(uri, r.status_code, start, r.elapsed.total_seconds(), chunks)
+        return 0
+
+    def recordStream(self, uri, status, start, wait, chunks):
+        """
+            Record a streamed GET in the timings.  chunks is the ReadCounter
+            the body was read through; the time not spent waiting for the
+            response or reading it went to parsing and handling the elements.
+        """
+        total = time.perf_counter() - start
+        parse = total - chunks.seconds - (wait or 0.0)
+        self.timings.addRequest("GET", uri, status, total, wait=wait, read=chunks.seconds,
+                                parse=parse, size=chunks.bytes)
+
+    def send(self, method, uri, payload=None):
+        """
+            Send a request with an optional JSON payload (a string), returning
+            the response text and a status that is non-zero on failure.
+        """
+        start = time.perf_counter()
+        headers = {}
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        r = self.request(method, uri, headers=headers, data=payload)
+        self.recordResponse(method, uri, r, start)
+        return r.text, 1 if r.status_code >= 300 else 0
+
+    def post(self, uri, payload):
+        """POST a JSON payload (a string), see send()."""
+        return self.send("POST", uri, payload)
+
+    def put(self, uri, payload):
+        """PUT a JSON payload (a string), see send()."""
+        return self.send("PUT", uri, payload)
+
+    def delete(self, uri):
+        """DELETE a URL, returning a status that is non-zero on failure."""
+        return self.send("DELETE", uri)[1]
@@ -0,0 +1,91 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Prometheus metrics for the node-exporter textfile collector.
+
+    A script run from cron adds its results as gauges and writes them to a
+    .prom file in the collector's directory, e.g.
+
+        /var/lib/node_exporter/textfile_collector/hms_discovery.prom
+
+    node-exporter reads the directory on every scrape, so the file is
+    replaced atomically and a scrape never sees it half written.
+"""
+
+import os
+import tempfile
+
+def escapeLabel(value):
+    """Escape a label value for the text format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def formatValue(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return "%d" % value
+    return repr(float(value))
+
+class Metrics():
+    """Metric samples grouped by name, written in the order they were added."""
+
+    def __init__(self):
+        # name -> (help, type, [(labels, value)])
+        self.families = {}
+
+    def add(self, name, value, labels=None, help="", mtype="gauge"):
+        """Add a sample.  The help and type of a name's first sample are used."""
+        family = self.families.setdefault(name, (help, mtype, []))
+        family[2].append((labels or {}, value))
+
+    def text(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        for name, (help, mtype, samples) in self.families.items():
+            if help:
+                lines.append("# HELP %s %s" % (name, help.replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE %s %s" % (name, mtype))
+            for labels, value in samples:
+                if labels:
+                    labelStr = ",".join('%s="%s"' % (k, escapeLabel(v)) for k, v in labels.items())
+                    lines.append("%s{%s} %s" % (name, labelStr, formatValue(value)))
+                else:
+                    lines.append("%s %s" % (name, formatValue(value)))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Replace the file at path with the metrics."""
+        directory = os.path.dirname(os.path.abspath(path))
+
+        # The temporary file is in the same directory so the rename is atomic.
+        # It doesn't end in .prom, so the collector ignores it until then.
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            # node-exporter usually runs as another user
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w") as f:
+                f.write(self.text())
+            os.replace(tmpname, path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
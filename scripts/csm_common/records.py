@@ -0,0 +1,96 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Compact record types for HSM and SLS data.
+
+    The scripts only read a handful of fields from each HSM component or SLS
+    hardware entry, so rather than keeping the full JSON dicts around for the
+    whole run these records keep just those fields in __slots__.  The type,
+    role, state and class strings repeat across every component and are
+    interned so all records share one copy of each.
+"""
+
+import sys
+
+def intern(value):
+    """Intern a string value, passing None through."""
+    if value is None:
+        return None
+    return sys.intern(value)
+
+class HSMComponent():
+    """An HSM State/Components entry."""
+    __slots__ = ("xname", "type", "role", "state", "xclass", "nid", "locked")
+
+    def __init__(self, xname, ctype, role=None, state=None, xclass=None, nid=None, locked=False):
+        self.xname = xname
+        self.type = intern(ctype)
+        self.role = intern(role)
+        self.state = intern(state)
+        self.xclass = intern(xclass)
+        self.nid = nid
+        self.locked = locked
+
+    @classmethod
+    def fromJSON(cls, data):
+        """Create a record from an HSM State/Components JSON entry."""
+        return cls(data['ID'], data.get('Type'),
+                   role=data.get('Role'),
+                   state=data.get('State'),
+                   xclass=data.get('Class'),
+                   nid=data.get('NID'),
+                   locked=data.get('Locked', False))
+
+    def __repr__(self):
+        return "HSMComponent(%s, %s, role=%s, state=%s, class=%s, nid=%s, locked=%s)" % (
+            self.xname, self.type, self.role, self.state, self.xclass, self.nid, self.locked)
+
+class SLSHardware():
+    """An SLS hardware entry."""
+    __slots__ = ("xname", "parent", "type", "xclass", "role", "nid", "aliases", "model")
+
+    def __init__(self, xname, parent, ctype, xclass=None, role=None, nid=None, aliases=(), model=None):
+        self.xname = xname
+        self.parent = parent
+        self.type = intern(ctype)
+        self.xclass = intern(xclass)
+        self.role = intern(role)
+        self.nid = nid
+        self.aliases = tuple(aliases)
+        self.model = intern(model)
+
+    @classmethod
+    def fromJSON(cls, data):
+        """Create a record from an SLS hardware JSON entry."""
+        extra_properties = data.get('ExtraProperties', {})
+        return cls(data['Xname'], data.get('Parent'), data['TypeString'],
+                   xclass=data.get('Class'),
+                   role=extra_properties.get('Role'),
+                   nid=extra_properties.get('NID'),
+                   aliases=extra_properties.get('Aliases', ()),
+                   model=extra_properties.get('Model'))
+
+    def __repr__(self):
+        return "SLSHardware(%s, parent=%s, %s, class=%s, role=%s, nid=%s, aliases=%s, model=%s)" % (
+            self.xname, self.parent, self.type, self.xclass, self.role, self.nid,
+            ','.join(self.aliases), self.model)
@@ -0,0 +1,170 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    On-disk snapshots of HSM/SLS API responses.
+
+    A snapshot is a directory holding the raw JSON body of each GET the scripts
+    make, one file per request URL.  It is used two ways:
+
+    - As an opt-in cache (--snapshot-cache): responses are saved as they are
+      fetched and reused on later runs while they are younger than the TTL.
+    - For offline replay (--from-snapshot): responses are only ever read from
+      the snapshot, no API calls are made.  This allows a system to be triaged
+      from data captured there with --snapshot-cache.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_TTL = 600
+CHUNK_SIZE = 64 * 1024
+
+# getopt long options understood by fromOpts()
+LONG_OPTS = ["snapshot-cache=", "snapshot-ttl=", "from-snapshot="]
+
+USAGE = """   --snapshot-cache=dir  Save the HSM/SLS data fetched by this run in dir and
+                         reuse it on later runs while it is fresh.
+   --snapshot-ttl=secs   Seconds cached data stays fresh (default %d).
+   --from-snapshot=dir   Replay HSM/SLS data previously saved in dir with
+                         --snapshot-cache. No API calls are made.""" % DEFAULT_TTL
+
+class Snapshot():
+    """A directory of saved API responses, keyed by request URL."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, replay=False):
+        self.path = path
+        self.ttl = ttl
+        self.replay = replay
+
+    def fileName(self, uri):
+        """Return the snapshot file name used for a request URL."""
+        parts = urlsplit(uri)
+        key = parts.path
+        if parts.query:
+            key += "?" + parts.query
+
+        name = re.sub(r"[^A-Za-z0-9.-]+", "_", key).strip("_")
+        if len(name) > 128:
+            # Long ID lists; keep it readable but unique.
+            name = name[:96] + "_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.path, name + ".json")
+
+    def open(self, uri):
+        """
+            Open the saved response for a request URL, as a binary file.
+            Returns None if there isn't one, or if it's older than the TTL
+            (TTL is not applied when replaying).
+        """
+        fname = self.fileName(uri)
+        try:
+            mtime = os.stat(fname).st_mtime
+        except FileNotFoundError:
+            return None
+
+        if not self.replay and self.ttl is not None and time.time() - mtime > self.ttl:
+            return None
+
+        return open(fname, "rb")
+
+    def load(self, uri):
+        """Return the saved response for a request URL as text, or None."""
+        f = self.open(uri)
+        if f is None:
+            return None
+        with f:
+            return f.read().decode("utf-8")
+
+    def save(self, uri, chunks):
+        """
+            Save a response being read as a sequence of byte chunks.  This is a
+            generator that passes the chunks through as they're written, the
+            saved file only replaces any previous one once all of the chunks
+            have been read.
+        """
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        committed = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmpname, self.fileName(uri))
+            committed = True
+        finally:
+            if not committed:
+                os.unlink(tmpname)
+
+    def store(self, uri, text):
+        """Save a response body given as text."""
+        for _ in self.save(uri, [text.encode("utf-8")]):
+            pass
+
+    def missing(self, uri):
+        """Report a request that can't be replayed from this snapshot."""
+        print("ERROR: No data for %s in snapshot %s." % (uri, self.path))
+
+def readChunks(f, size=CHUNK_SIZE):
+    """Read a binary file as a sequence of byte chunks."""
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def fromOpts(opts):
+    """
+        Create a Snapshot from parsed getopt options (see LONG_OPTS).  Returns
+        None if no snapshot was asked for.  Raises ValueError on bad options.
+    """
+    cache_dir = None
+    replay_dir = None
+    ttl = DEFAULT_TTL
+
+    for opt, arg in opts:
+        if opt == "--snapshot-cache":
+            cache_dir = arg
+        elif opt == "--from-snapshot":
+            replay_dir = arg
+        elif opt == "--snapshot-ttl":
+            try:
+                ttl = int(arg)
+            except ValueError:
+                raise ValueError("Invalid --snapshot-ttl: '%s'" % arg)
+
+    if cache_dir is not None and replay_dir is not None:
+        raise ValueError("Can't use both --snapshot-cache and --from-snapshot.")
+
+    if replay_dir is not None:
+        if not os.path.isdir(replay_dir):
+            raise ValueError("Snapshot directory not found: %s" % replay_dir)
+        return Snapshot(replay_dir, replay=True)
+
+    if cache_dir is not None:
+        return Snapshot(cache_dir, ttl=ttl)
+
+    return None
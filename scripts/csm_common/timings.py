@@ -0,0 +1,232 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Run timings and profiling (--timings, --profile).
+
+    A script splits its run into phases (auth, fetch, checks, ...) and the
+    HMS client records every request it makes: how long the service took to
+    answer, how long reading the body took, how long parsing it took and its
+    size.  With --timings a breakdown is printed to stderr when the script
+    exits, so the report on stdout is unchanged.  --profile writes cProfile
+    data for the run, for use with "python3 -m pstats FILE".
+"""
+
+import atexit
+import contextlib
+import sys
+import threading
+import time
+
+# getopt long options understood by fromOpts()
+LONG_OPTS = ["timings", "profile="]
+
+USAGE = """   --timings             Print a breakdown of where the run's time went,
+                         with every HTTP request, to stderr at the end.
+   --profile=file        Write cProfile data for the run to file.  Worker
+                         processes (--jobs) aren't profiled."""
+
+class ReadCounter():
+    """Iterate over response chunks, counting their bytes and read time."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            chunk = next(self.chunks)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.bytes += len(chunk)
+        return chunk
+
+class Request():
+    """One recorded request."""
+    __slots__ = ("phase", "method", "uri", "status", "total", "wait", "read", "parse", "size")
+
+    def __init__(self, phase, method, uri, status, total, wait, read, parse, size):
+        # The Timings.phases entry it was made in, None if outside any phase
+        self.phase = phase
+        self.method = method
+        self.uri = uri
+        # HTTP status, None for data read from a snapshot, or a short label
+        # for a request that isn't HTTP
+        self.status = status
+        # Seconds: the whole request, waiting for the response headers,
+        # reading the body and parsing it.  Unknown parts are None.
+        self.total = total
+        self.wait = wait
+        self.read = read
+        self.parse = parse
+        self.size = size
+
+class Timings():
+    """
+        Phase and request timings for a run.  When not enabled nothing is
+        recorded, so scripts and the HMS client can call it unconditionally.
+        Safe to share between threads.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.currentPhase = None
+        # [name, seconds, sleep seconds], in the order they ran
+        self.phases = []
+        self.requests = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as the named phase."""
+        if not self.enabled:
+            yield
+            return
+
+        entry = [name, 0.0, 0.0]
+        with self.lock:
+            self.phases.append(entry)
+            outer = self.currentPhase
+            self.currentPhase = entry
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry[1] = time.perf_counter() - start
+                self.currentPhase = outer
+
+    def sleep(self, seconds):
+        """time.sleep(), counted as sleep time in the current phase."""
+        time.sleep(seconds)
+        if self.enabled:
+            with self.lock:
+                if self.currentPhase is not None:
+                    self.currentPhase[2] += seconds
+
+    def addRequest(self, method, uri, status, total, wait=None, read=None, parse=None, size=0):
+        """Record a request (see Request for the fields)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.requests.append(Request(self.currentPhase, method, uri, status, total, wait, read, parse, size))
+
+    def phaseSeconds(self):
+        """Return the seconds spent in each phase by name."""
+        seconds = {}
+        with self.lock:
+            for name, elapsed, _ in self.phases:
+                seconds[name] = seconds.get(name, 0.0) + elapsed
+        return seconds
+
+    def report(self, out=sys.stderr):
+        """Print the phase and request breakdown."""
+        total = time.perf_counter() - self.start
+
+        def seconds(value):
+            return "%9.3f" % value if value is not None else "%9s" % "-"
+
+        print("", file=out)
+        print("Timings", file=out)
+        print("=======", file=out)
+        print("%-24s %9s %9s %9s %9s" % ("Phase", "Seconds", "Requests", "Req secs", "Sleep"), file=out)
+        for entry in self.phases:
+            name, elapsed, slept = entry
+            reqs = [req for req in self.requests if req.phase is entry]
+            print("%-24s %s %9d %s %s" % (name[:24], seconds(elapsed), len(reqs),
+                                          seconds(sum(req.total for req in reqs)), seconds(slept)), file=out)
+        print("%-24s %s %9d" % ("Total", seconds(total), len(self.requests)), file=out)
+        print("Requests made at the same time overlap, so their seconds can add up to", file=out)
+        print("more than their phase's.", file=out)
+
+        if not self.requests:
+            return
+        print("", file=out)
+        print("%9s %9s %9s %9s %11s %6s  %s" % ("Total", "Wait", "Read", "Parse", "Bytes", "Status", "Request"),
+              file=out)
+        for req in self.requests:
+            status = "%6s" % (req.status if req.status is not None else "snap")
+            print("%s %s %s %s %11d %s  %s %s" % (seconds(req.total), seconds(req.wait), seconds(req.read),
+                                                   seconds(req.parse), req.size, status, req.method, req.uri),
+                  file=out)
+
+def fromOpts(opts, record=False):
+    """
+        Create the Timings for a run from parsed getopt options (see
+        LONG_OPTS), starting the profiler if one was asked for.  The report
+        is printed and the profile written when the script exits.  With
+        record the timings are kept even without --timings, for a script
+        that reports them itself.
+    """
+    enabled = False
+    profile_path = None
+    for opt, arg in opts:
+        if opt == "--timings":
+            enabled = True
+        elif opt == "--profile":
+            profile_path = arg
+
+    timings = Timings(enabled or record)
+    if enabled:
+        atexit.register(timings.report)
+
+    if profile_path is not None:
+        startProfile(profile_path)
+
+    return timings
+
+def startProfile(path):
+    """
+        Profile the rest of the run, including threads started from now on,
+        and write the merged stats to path at exit.
+    """
+    import cProfile
+    import pstats
+
+    profilers = [cProfile.Profile()]
+
+    def profileThread(*args):
+        # Called on the first event in each new thread: hand over to a
+        # profiler of its own, cProfile only ever profiles one thread.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    def writeProfile():
+        threading.setprofile(None)
+        profilers[0].disable()
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        print("Wrote profile to %s" % path, file=sys.stderr)
+
+    atexit.register(writeProfile)
+    threading.setprofile(profileThread)
+    profilers[0].enable()
@@ -0,0 +1,105 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Keycloak token cache shared between script runs.
+
+    Getting a token means reading the admin client secret from Kubernetes and
+    then asking Keycloak for a token, two round trips every script pays before
+    doing any real work.  When the HMS_TOKEN_CACHE environment variable names
+    a file, the token is saved there and reused by later runs until shortly
+    before it expires:
+
+        export HMS_TOKEN_CACHE=/root/.cache/csm/hms-token.json
+
+    The file is only readable by its owner, and a cache file anyone else can
+    read or write is ignored rather than trusted.
+"""
+
+import json
+import os
+import stat
+import tempfile
+import time
+
+ENV_VAR = "HMS_TOKEN_CACHE"
+
+# Stop using a cached token this many seconds before it expires, so it
+# doesn't expire in the middle of a run.
+EXPIRY_MARGIN = 60
+
+class TokenCache():
+    """A token saved in a file, with the time it expires."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return the cached token, or None if there isn't a usable one."""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return None
+
+        with os.fdopen(fd, "r") as f:
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.getuid() or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                return None
+            try:
+                data = json.load(f)
+                token = data["access_token"]
+                expires_at = float(data["expires_at"])
+            except (ValueError, KeyError, TypeError):
+                return None
+
+        if expires_at - EXPIRY_MARGIN <= time.time():
+            return None
+        return token
+
+    def save(self, token, expires_in):
+        """Save a token that expires in expires_in seconds."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        # mkstemp creates the file 0600
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": token, "expires_at": time.time() + expires_in}, f)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def clear(self):
+        """Forget the cached token."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+def fromEnv():
+    """Return the TokenCache named by HMS_TOKEN_CACHE, or None if it's unset."""
+    path = os.environ.get(ENV_VAR)
+    if not path:
+        return None
+    return TokenCache(path)
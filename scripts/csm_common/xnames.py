@@ -0,0 +1,125 @@
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+    Xname parsing.
+
+    An xname is a sequence of elements, each a letter tag and a number:
+    x3000c0s17b1n0 is cabinet x3000, chassis c0, slot s17, BMC b1, node n0.
+
+    parent(), cabinet() and slot() each take a single match of a precompiled
+    regex.  parse() splits an xname into typed elements for element by element
+    comparisons and caches the result, since the same xnames (include and
+    exclude patterns, BMCs of several nodes) get compared over and over.
+
+    Xnames are compared element by element, never as strings: x100 is not an
+    ancestor of x1000c0, and s1 is not a prefix of s17.
+"""
+
+import functools
+import re
+
+# The system, a cabinet or a CDU has the system as its parent.
+SYSTEM = "s0"
+
+element_regex = re.compile(r"([a-z]+)([0-9]+)")
+parent_regex = re.compile(r"((?:[a-z]+[0-9]+)*?)([a-z]+)[0-9]+")
+cabinet_regex = re.compile(r"x[0-9]+(?![0-9])")
+slot_regex = re.compile(r"x[0-9]+c[0-9]+[sr][0-9]+(?![0-9])")
+
+class Xname():
+    """A parsed xname."""
+    __slots__ = ("xname", "elements")
+
+    def __init__(self, xname, elements):
+        self.xname = xname
+        # ((tag, number), ...), e.g. (("x", 3000), ("c", 0), ("s", 17))
+        self.elements = elements
+
+    def __len__(self):
+        return len(self.elements)
+
+    def isWithin(self, other):
+        """True if this xname is other or one of its descendants."""
+        return self.elements[:len(other.elements)] == other.elements
+
+    def __repr__(self):
+        return "Xname(%s)" % self.xname
+
+@functools.lru_cache(maxsize=None)
+def parse(xname):
+    """Parse an xname.  Returns None if it isn't one."""
+    elements = []
+    end = 0
+    for tag, num in element_regex.findall(xname):
+        end += len(tag) + len(num)
+        elements.append((tag, int(num)))
+
+    # Anything findall() skipped over means it's not an xname
+    if not elements or end != len(xname):
+        return None
+    return Xname(xname, tuple(elements))
+
+def parent(xname):
+    """
+        Return the parent of an xname: the system for cabinets and CDUs,
+        otherwise the xname without its last element.  Returns None if it
+        isn't an xname, including None, so parent(parent(xname)) is safe.
+    """
+    if xname is None:
+        return None
+    match = parent_regex.fullmatch(xname)
+    if match is None:
+        return None
+    if match.group(1):
+        return match.group(1)
+    if match.group(2) in ("x", "d"):
+        return SYSTEM
+    return None
+
+def cabinet(xname):
+    """Return the cabinet an xname is in, or None if it isn't in one."""
+    match = cabinet_regex.match(xname)
+    if match is None:
+        return None
+    return match.group(0)
+
+def slot(xname):
+    """
+        Return the slot (xXcCsS or xXcCrR) an xname is in, or None if it
+        isn't in one.
+    """
+    match = slot_regex.match(xname)
+    if match is None:
+        return None
+    return match.group(0)
+
+def isWithin(xname, ancestor):
+    """
+        True if xname is ancestor or one of its descendants.  Either not being
+        an xname is never a match.
+    """
+    parsed = parse(xname)
+    parsed_ancestor = parse(ancestor)
+    if parsed is None or parsed_ancestor is None:
+        return False
+    return parsed.isWithin(parsed_ancestor)
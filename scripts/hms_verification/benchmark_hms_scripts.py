@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# Benchmark verify_hsm_discovery.py, set_ssh_keys.py,
+# river_rf_endpoint_discovery_fixup.py and lock_management_nodes.py against a synthetic system made by
+# gen_synthetic_inventory.py (or any snapshot saved with --snapshot-cache).
+# Each script's own functions are run phase by phase on the replayed data and
+# the wall time and peak Python memory of every phase is reported.  Nothing
+# talks to the API gateway, pings or changes anything, so this can run on any
+# machine with the scripts' Python dependencies installed.
+#
+# Each phase is run twice, once for the time and once under tracemalloc for
+# the peak memory, so tracing overhead doesn't skew the times.  The peak is
+# memory allocated during the phase, it doesn't include the data the phase was
+# handed or memory used in --jobs worker processes.
+
+import contextlib
+import getopt
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_dir, ".."))
+from csm_common import hmsclient
+from csm_common import snapshot
+
+import gen_synthetic_inventory
+
+# Load a script as a module.  It's registered in sys.modules so the verify
+# --jobs process pool can find its functions.
+
+def loadScript(name, path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(script_dir, path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Run one phase, returning its result and adding its (script, phase, seconds,
+# peak bytes) to results.  The scripts' report output is discarded.
+
+def runPhase(results, script, phase, func, *args):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        ret = func(*args)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    results.append((script, phase, elapsed, peak))
+    return ret
+
+def checkStat(script, what, stat):
+    if stat != 0:
+        raise RuntimeError("%s: %s fetch returned non-zero" % (script, what))
+
+def benchVerify(results, hms, jobs):
+    verify = loadScript("verify_hsm_discovery", "verify_hsm_discovery.py")
+
+    inventory = runPhase(results, "verify", "fetch", verify.getInventoryData, hms)
+    for (data, stat), what in zip(inventory, ["HSM components", "HSM RFEP", "HSM node enclosure", "SLS hardware"]):
+        checkStat("verify", what, stat)
+    ((hsm_state_components, _), (hsm_redfish_endpoints, _),
+     (hsm_inventory_node_enclosures, _), (sls_index, _)) = inventory
+
+    clSorted = sls_index.getSortedCabinets()
+    runPhase(results, "verify", "summary", verify.genSummary, clSorted, hsm_state_components)
+
+    check_data = verify.CheckData(sls_index, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures)
+    runPhase(results, "verify", "details", verify.genCabinetDetails, check_data, verify.classifyCabinets(clSorted), jobs)
+
+def benchSetSSHKeys(results, hms):
+    ssh = loadScript("set_ssh_keys", "../admin_access/set_ssh_keys.py")
+
+    def fetch():
+        comps, stat = ssh.getHSMComponents(hms)
+        checkStat("set_ssh_keys", "HSM components", stat)
+        rfepIDs, stat = ssh.getHSMRFEPs(hms)
+        checkStat("set_ssh_keys", "HSM RFEP", stat)
+        return comps, rfepIDs
+
+    comps, rfepIDs = runPhase(results, "set_ssh_keys", "fetch", fetch)
+    runPhase(results, "set_ssh_keys", "select", ssh.selectBMCs, comps, rfepIDs, [], [])
+
+def benchRiverFixup(results, hms):
+    fixup = loadScript("river_rf_endpoint_discovery_fixup", "river_rf_endpoint_discovery_fixup.py")
+    bmc_filter = gen_synthetic_inventory.RIVER_BMC_FILTER
+
+    def fetch():
+        rfepData, stat = fixup.getHSMRFEP(hms, bmc_filter, useSnapshot=True)
+        checkStat("river_fixup", "HSM RFEP", stat)
+        ethData, stat = fixup.getHSMEthData(hms, bmc_filter, useSnapshot=True)
+        checkStat("river_fixup", "HSM EthernetInterfaces", stat)
+        slsData, stat = fixup.getSLSData(hms, gen_synthetic_inventory.RIVER_NODE_FILTER, useSnapshot=True)
+        checkStat("river_fixup", "SLS hardware", stat)
+        return rfepData, ethData, slsData
+
+    rfepData, ethData, slsData = runPhase(results, "river_fixup", "fetch", fetch)
+    runPhase(results, "river_fixup", "select", fixup.genBMCList, rfepData, ethData, slsData, False)
+
+# Only the management node selection is benchmarked; locking and unlocking
+# are POSTs, which can't be replayed.
+
+def benchLock(results, hms):
+    lock = loadScript("lock_management_nodes", "../admin_access/lock_management_nodes.py")
+
+    compStatus, stat = runPhase(results, "lock", "fetch", lock.selectComponents, hms, lock.Selection())
+    checkStat("lock", "HSM lock status", stat)
+
+benchmarks = {
+    "verify": benchVerify,
+    "set_ssh_keys": benchSetSSHKeys,
+    "river_fixup": benchRiverFixup,
+    "lock": benchLock,
+}
+
+def printResults(results):
+    print("%-14s %-8s %10s %12s" % ("Script", "Phase", "Seconds", "Peak MiB"))
+    print("%-14s %-8s %10s %12s" % ("-" * 14, "-" * 8, "-" * 10, "-" * 12))
+    for script, phase, elapsed, peak in results:
+        print("%-14s %-8s %10.3f %12.1f" % (script, phase, elapsed, peak / (1024.0 * 1024.0)))
+
+def usage():
+    print("Usage: %s [options]" % sys.argv[0])
+    print(" ")
+    print("   --snapshot=dir   Benchmark against a saved snapshot instead of")
+    print("                    generating a system.  The size options are ignored.")
+    print("   --scripts=list   Comma-separated list of scripts to benchmark")
+    print("                    (default %s)." % ",".join(benchmarks))
+    print("   --jobs=N         Pass --jobs N to verify_hsm_discovery.py.")
+    print(gen_synthetic_inventory.SIZE_USAGE)
+    print(" ")
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h",
+            ["help", "snapshot=", "scripts=", "jobs="] + gen_synthetic_inventory.SIZE_OPTS)
+    except getopt.GetoptError:
+        usage()
+        return 1
+
+    snapshot_dir = None
+    scripts = list(benchmarks)
+    jobs = 1
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+        elif opt == "--snapshot":
+            snapshot_dir = arg
+        elif opt == "--scripts":
+            scripts = arg.split(",")
+            for script in scripts:
+                if script not in benchmarks:
+                    print("ERROR: Unknown script '%s'." % script)
+                    return 1
+        elif opt == "--jobs":
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                print("ERROR: Invalid --jobs: '%s'" % arg)
+                return 1
+
+    try:
+        size = gen_synthetic_inventory.sizeFromOpts(opts)
+    except ValueError as err:
+        print("ERROR: %s" % err)
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if snapshot_dir is None:
+            snapshot_dir = tmp_dir
+            start = time.perf_counter()
+            system = gen_synthetic_inventory.generate(**size)
+            system.write(snapshot_dir)
+            print("Generated %d SLS hardware entries, %d HSM components in %.1fs." %
+                (len(system.sls_hardware), len(system.hsm_components), time.perf_counter() - start))
+            system = None
+        elif not os.path.isdir(snapshot_dir):
+            print("ERROR: Snapshot directory not found: %s" % snapshot_dir)
+            return 1
+
+        hms = hmsclient.HMSClient(snapshot.Snapshot(snapshot_dir, replay=True))
+        results = []
+        for script in scripts:
+            try:
+                if script == "verify":
+                    benchmarks[script](results, hms, jobs)
+                else:
+                    benchmarks[script](results, hms)
+            except RuntimeError as err:
+                print("ERROR: %s" % err)
+                return 1
+
+    printResults(results)
+    return 0
+
+if __name__ == "__main__":
+    ret = main()
+    sys.exit(ret)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# Measure how long the Python scripts take to start, and fail if any takes
+# longer than its budget.  Each script is run with -h (make_api_call.py with a
+# bad method), which does all of its module level imports and then exits
+# without talking to anything.  The wall time is the best of several runs, and
+# one extra run under "python3 -X importtime" shows which imports the time
+# goes to.
+#
+# The budgets are for the time a script adds on top of the interpreter's own
+# startup ("python3 -c pass", which depends on what's installed in
+# site-packages rather than on the scripts).  They're for a lightly loaded
+# NCN; pass --scale to loosen them on a slower machine.
+
+import getopt
+import os
+import subprocess
+import sys
+import time
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+scripts_root = os.path.join(script_dir, "..")
+
+# (script, arguments, extra environment, budget in milliseconds)
+SCRIPTS = [
+    ("hms_verification/verify_hsm_discovery.py", ["-h"], {}, 50),
+    ("hms_verification/river_rf_endpoint_discovery_fixup.py", ["-h"], {}, 50),
+    ("admin_access/set_ssh_keys.py", ["-h"], {}, 50),
+    ("admin_access/lock_management_nodes.py", ["-h"], {}, 50),
+    ("networking/DNS/dns_records.py", ["-h"], {}, 50),
+    # make_api_call.py only imports requests once its environment is checked
+    ("node_management/make_api_call.py", [],
+     {"USERNAME": "", "IPMI_PASSWORD": "", "VENDOR": "", "url": "", "method": "none"}, 50),
+]
+
+# Run a script once, returning the wall time in seconds and its stderr.  With
+# no path the interpreter alone is run.
+
+def runScript(path, args, env, pythonOpts=()):
+    if path is None:
+        cmd = [sys.executable] + list(pythonOpts) + ["-c", "pass"]
+    else:
+        cmd = [sys.executable] + list(pythonOpts) + [os.path.join(scripts_root, path)] + args
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=dict(os.environ, **env), stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, proc.stderr
+
+# Parse "-X importtime" output into (cumulative microseconds, module) for the
+# top level imports, the ones the script itself (or the interpreter) made.
+
+def topLevelImports(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        name = fields[2].rstrip()
+        if name.startswith("  "):
+            continue
+        imports.append((cumulative, name.strip()))
+    return imports
+
+def usage():
+    print("Usage: %s [options]" % sys.argv[0])
+    print(" ")
+    print("   --runs=N       Runs per script, the best time is used (default 5).")
+    print("   --scale=F      Multiply the budgets by F (default 1.0).")
+    print("   --top=N        Show the N slowest imports of each script (default 5).")
+    print(" ")
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "runs=", "scale=", "top="])
+    except getopt.GetoptError:
+        usage()
+        return 1
+
+    runs = 5
+    scale = 1.0
+    top = 5
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+        try:
+            if opt == "--runs":
+                runs = int(arg)
+            elif opt == "--scale":
+                scale = float(arg)
+            elif opt == "--top":
+                top = int(arg)
+        except ValueError:
+            print("ERROR: Invalid %s: '%s'" % (opt, arg))
+            return 1
+    if runs < 1 or scale <= 0 or top < 0:
+        print("ERROR: --runs and --scale must be positive, --top not negative.")
+        return 1
+
+    interpreter = min(runScript(None, [], {})[0] for _ in range(runs)) * 1000.0
+    _, stderr = runScript(None, [], {}, ["-X", "importtime"])
+    interpreterImports = set(name for _, name in topLevelImports(stderr))
+    print("Interpreter startup: %.1f ms" % interpreter)
+    print(" ")
+
+    over = 0
+    print("%-54s %8s %8s %8s" % ("Script", "Total ms", "Added ms", "Budget"))
+    print("%-54s %8s %8s %8s" % ("-" * 54, "-" * 8, "-" * 8, "-" * 8))
+    for path, scriptArgs, env, budget in SCRIPTS:
+        best = min(runScript(path, scriptArgs, env)[0] for _ in range(runs)) * 1000.0
+        added = max(0.0, best - interpreter)
+        budget *= scale
+        status = ""
+        if added > budget:
+            status = "  OVER BUDGET"
+            over += 1
+        print("%-54s %8.1f %8.1f %8.0f%s" % (path, best, added, budget, status))
+
+        # The slowest imports the script made itself
+        _, stderr = runScript(path, scriptArgs, env, ["-X", "importtime"])
+        imports = [imp for imp in topLevelImports(stderr) if imp[1] not in interpreterImports]
+        for cumulative, name in sorted(imports, reverse=True)[:top]:
+            print("    %-50s %8.1f" % (name, cumulative / 1000.0))
+
+    if over:
+        print("ERROR: %d script(s) over their startup budget." % over)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    ret = main()
+    sys.exit(ret)
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# Generate HSM and SLS data for a synthetic system of any size, written as a
+# snapshot directory (see csm_common/snapshot.py).  The snapshot can be
+# replayed by verify_hsm_discovery.py, set_ssh_keys.py,
+# river_rf_endpoint_discovery_fixup.py and lock_management_nodes.py (for the
+# default management node selection or --xname) with --from-snapshot, and is
+# what benchmark_hms_scripts.py runs them against.
+#
+# The system is laid out the way real ones are:
+#
+#   River cabinets (x3000...)    Management NCNs and UANs in the first one,
+#                                then 1U compute nodes and dense 4-node
+#                                Gigabyte chassis with a CMC (b999).  Two
+#                                PDU controllers, one HSN switch and a
+#                                management switch the BMCs are cabled to.
+#   Mountain cabinets (x1000...) 8 chassis of 8 compute blades, 2 BMCs and 4
+#                                nodes per blade, 8 switch blades per chassis.
+#   Hill cabinets (x9000...)     EX2000, chassis c1 and c3.
+#   EX2500 cabinets (x8000...)   1-3 liquid cooled chassis plus a PDU.
+#
+# A small fraction of components are left undiscovered in HSM, missing their
+# RedfishEndpoint or uncabled, and some blades are empty, so the checks see
+# the same mix of PASS and FAIL results they would on a real system.
+
+import getopt
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from csm_common import snapshot
+from csm_common import xnames
+
+HSM_URL = "https://api-gw-service-nmn.local/apis/smd/hsm/v2"
+SLS_URL = "https://api-gw-service-nmn.local/apis/sls/v1"
+
+# Filters the scripts use on their requests.
+RIVER_BMC_FILTER = "?type=nodeBMC&type=routerBMC"
+RIVER_NODE_FILTER = "?type=comptype_node&class=River"
+
+# lock_management_nodes.py, management nodes and the NodeBMCs they're under,
+# and every node for --xname selections
+LOCK_NODE_FILTER = "?type=Node&role=Management"
+LOCK_BMC_FILTER = "?type=NodeBMC"
+LOCK_ALL_NODE_FILTER = "?type=Node"
+
+# verify_hsm_discovery.py
+VERIFY_COMPONENT_TYPES = ("Node", "NodeBMC", "RouterBMC", "ChassisBMC", "CabinetPDUController",
+                          "ComputeModule", "RouterModule")
+VERIFY_COMPONENT_FILTER = "?type=" + "&type=".join(VERIFY_COMPONENT_TYPES)
+
+# set_ssh_keys.py, as (filter, types, classes)
+SSH_BMC_FILTERS = [
+    ("?type=ChassisBMC&type=NodeBMC&type=RouterBMC&class=Mountain&class=Hill",
+        ("ChassisBMC", "NodeBMC", "RouterBMC"), ("Mountain", "Hill")),
+    ("?type=RouterBMC&class=River", ("RouterBMC",), ("River",)),
+]
+SSH_RFEP_FILTER = "?type=ChassisBMC&type=NodeBMC&type=RouterBMC"
+
+DEFAULT_FAULT_RATE = 0.02
+
+NODE_CARD_MODELS = ["WindomNodeCard", "GrizzlyPkNodeCard", "BardPeakNC"]
+
+class SyntheticSystem():
+    """HSM and SLS data for a generated system."""
+
+    def __init__(self, seed=0, fault_rate=DEFAULT_FAULT_RATE):
+        self.random = random.Random(seed)
+        self.fault_rate = fault_rate
+
+        self.sls_hardware = []
+        self.hsm_components = []
+        self.redfish_endpoints = []
+        self.node_enclosures = []
+        self.ethernet_interfaces = []
+
+        self.nextNID = 1
+        self.nextMAC = 1
+        self.mgmtCounts = {"m": 0, "w": 0, "s": 0}
+        self.cabinets = []
+
+    def fault(self):
+        return self.random.random() < self.fault_rate
+
+    def addSLS(self, xname, parent, sls_type, type_string, xclass, extra=None):
+        self.sls_hardware.append({
+            "Parent": parent,
+            "Xname": xname,
+            "Type": sls_type,
+            "Class": xclass,
+            "TypeString": type_string,
+            "ExtraProperties": extra or {},
+        })
+
+    def addHSM(self, xname, ctype, xclass, state="Ready", role=None, subrole=None, nid=None):
+        comp = {
+            "ID": xname,
+            "Type": ctype,
+            "State": state,
+            "Flag": "OK",
+            "Enabled": True,
+            "NetType": "Sling",
+            "Arch": "X86",
+            "Locked": False,
+        }
+        # HSM leaves Class out for some types, PDU outlets in particular
+        if xclass is not None:
+            comp["Class"] = xclass
+        if role is not None:
+            comp["Role"] = role
+        if subrole is not None:
+            comp["SubRole"] = subrole
+        if nid is not None:
+            comp["NID"] = nid
+        self.hsm_components.append(comp)
+
+    def addRFEP(self, xname, ctype):
+        self.redfish_endpoints.append({
+            "ID": xname,
+            "Type": ctype,
+            "Hostname": xname,
+            "Domain": "",
+            "FQDN": xname,
+            "Enabled": True,
+            "User": "root",
+            "Password": "",
+            "RediscoverOnUpdate": True,
+            "DiscoveryInfo": {"LastDiscoveryStatus": "DiscoverOK"},
+        })
+
+    def addEthernetInterface(self, xname, ctype):
+        mac = "b4:2e:99:%02x:%02x:%02x" % ((self.nextMAC >> 16) & 0xff, (self.nextMAC >> 8) & 0xff, self.nextMAC & 0xff)
+        ip = "10.254.%d.%d" % ((self.nextMAC >> 8) & 0xff, self.nextMAC & 0xff)
+        self.nextMAC += 1
+        self.ethernet_interfaces.append({
+            "ID": mac.replace(":", ""),
+            "Description": "",
+            "MACAddress": mac,
+            "LastUpdate": "2026-01-01T00:00:00.000000Z",
+            "ComponentID": xname,
+            "Type": ctype,
+            "IPAddresses": [{"IPAddress": ip}],
+        })
+
+    # A controller that is discovered unless a fault is injected: in HSM State
+    # Components, with a RedfishEndpoint and an EthernetInterface.  Returns
+    # True if it was discovered.
+    def addController(self, xname, ctype, xclass, river=False):
+        if self.fault():
+            # Never discovered
+            if river:
+                self.addEthernetInterface(xname, ctype)
+            return False
+        self.addHSM(xname, ctype, xclass)
+        if river:
+            self.addEthernetInterface(xname, ctype)
+        if not self.fault():
+            self.addRFEP(xname, ctype)
+        return True
+
+    def addNode(self, xname, xclass, role, subrole=None, alias=None, discovered=True):
+        bmc = xnames.parent(xname)
+        nid = None
+        extra = {"Role": role}
+        if subrole is not None:
+            extra["SubRole"] = subrole
+        if role == "Compute":
+            nid = self.nextNID
+            self.nextNID += 1
+            extra["NID"] = nid
+            alias = alias or "nid%06d" % nid
+        if alias is not None:
+            extra["Aliases"] = [alias]
+        self.addSLS(xname, bmc, "comptype_node", "Node", xclass, extra)
+        if discovered and not self.fault():
+            self.addHSM(xname, "Node", xclass, role=role, subrole=subrole, nid=nid)
+
+    def addMgmtPort(self, cab, switch, port, nic):
+        if self.fault():
+            return
+        switch_xname = "%sc0w%d" % (cab, switch)
+        self.addSLS("%sj%d" % (switch_xname, port), switch_xname,
+                    "comptype_mgmt_switch_connector", "MgmtSwitchConnector", "River",
+                    {"NodeNics": [nic], "VendorName": "1/1/%d" % port})
+
+    def addCabinet(self, cab, xclass, model=None):
+        extra = {}
+        if model is not None:
+            extra["Model"] = model
+        self.addSLS(cab, "s0", "comptype_cabinet", "Cabinet", xclass, extra)
+        self.cabinets.append(cab)
+
+    def addCabinetPDU(self, cab, xclass, pdus=2, mgmt_switch=None):
+        for i in range(pdus):
+            pdu = "%sm%dp0" % (cab, i)
+            self.addSLS(pdu, cab, "comptype_cab_pdu_controller", "CabinetPDUController", xclass)
+            if self.addController(pdu, "CabinetPDUController", xclass, river=True):
+                # Outlets, which the scripts don't use but HSM returns
+                for outlet in range(1, 25):
+                    self.addHSM("%sv%d" % (pdu, outlet), "CabinetPDUPowerConnector", None, state="On")
+            if mgmt_switch is not None:
+                self.addMgmtPort(cab, mgmt_switch, 47 - i, pdu)
+
+    def addRiverCabinet(self, cab, first=False):
+        self.addCabinet(cab, "River")
+        self.addCabinetPDU(cab, "River", mgmt_switch=38)
+
+        # Top of rack HSN switch
+        rtr = "%sc0r39b0" % cab
+        self.addSLS(rtr, "%sc0r39" % cab, "comptype_rtr_bmc", "RouterBMC", "River")
+        self.addController(rtr, "RouterBMC", "River", river=True)
+        self.addMgmtPort(cab, 38, 46, rtr)
+
+        # Management nodes and UANs fill the bottom of the first cabinet,
+        # compute nodes the rest.
+        nodes = []
+        if first:
+            for kind, count in (("m", 3), ("w", 5), ("s", 3)):
+                for i in range(count):
+                    self.mgmtCounts[kind] += 1
+                    alias = "ncn-%s%03d" % (kind, self.mgmtCounts[kind])
+                    subrole = {"m": "Master", "w": "Worker", "s": "Storage"}[kind]
+                    nodes.append(("Management", subrole, alias))
+            for i in range(2):
+                nodes.append(("Application", "UAN", "uan%02d" % (i + 1)))
+
+        port = 1
+        slot = 1
+        while slot < 37:
+            if nodes:
+                role, subrole, alias = nodes.pop(0)
+            else:
+                role, subrole, alias = "Compute", None, None
+
+            if role == "Compute" and slot < 35 and slot % 8 == 3:
+                # Gigabyte dense chassis, 4 nodes behind a CMC
+                for b in range(1, 5):
+                    bmc = "%sc0s%db%d" % (cab, slot, b)
+                    self.addNode(bmc + "n0", "River", role)
+                    self.addController(bmc, "NodeBMC", "River", river=True)
+                    self.addMgmtPort(cab, 38, port, bmc)
+                    port += 1
+                cmc = "%sc0s%db999" % (cab, slot)
+                self.addSLS(cmc, "%sc0s%d" % (cab, slot), "comptype_chassis_bmc", "ChassisBMC", "River")
+                self.addController(cmc, "NodeBMC", "River", river=True)
+                self.addMgmtPort(cab, 38, port, cmc)
+                port += 1
+                slot += 2
+                continue
+
+            bmc = "%sc0s%db0" % (cab, slot)
+            self.addNode(bmc + "n0", "River", role, subrole, alias)
+            self.addController(bmc, "NodeBMC", "River", river=True)
+            # ncn-m001's BMC is normally on the site network
+            if alias != "ncn-m001":
+                self.addMgmtPort(cab, 38, port, bmc)
+            port += 1
+            slot += 1 if role == "Compute" else 2
+
+    def addLiquidCooledChassis(self, cab, chassis, xclass):
+        chassis_bmc = "%sc%db0" % (cab, chassis)
+        self.addHSM("%sc%d" % (cab, chassis), "Chassis", xclass, state="On")
+        self.addSLS(chassis_bmc, "%sc%d" % (cab, chassis), "comptype_chassis_bmc", "ChassisBMC", xclass)
+        self.addController(chassis_bmc, "ChassisBMC", xclass)
+
+        for s in range(8):
+            slot = "%sc%ds%d" % (cab, chassis, s)
+            empty = self.random.random() < 0.05
+            self.addHSM(slot, "ComputeModule", xclass, state="Empty" if empty else "On")
+
+            model = self.random.choice(NODE_CARD_MODELS)
+            if not empty:
+                self.addHSM(slot + "e0", "NodeEnclosure", xclass, state="On")
+                self.node_enclosures.append({
+                    "ID": slot + "e0",
+                    "Type": "NodeEnclosure",
+                    "Ordinal": 0,
+                    "Status": "Populated",
+                    "PopulatedFRU": {
+                        "FRUID": "NodeEnclosure.%s.%s" % (model, slot),
+                        "Type": "NodeEnclosure",
+                        "NodeEnclosureFRUInfo": {"Model": model},
+                    },
+                })
+
+            # SLS always has the full 2 BMC / 4 node layout, the blade decides
+            # how much of it exists.
+            for b in range(2):
+                bmc = "%sb%d" % (slot, b)
+                present = not empty and (model != "GrizzlyPkNodeCard" or b == 0)
+                if present:
+                    self.addController(bmc, "NodeBMC", xclass)
+                for n in range(2):
+                    self.addNode("%sn%d" % (bmc, n), xclass, "Compute", discovered=present)
+
+        for r in range(8):
+            rtr_slot = "%sc%dr%d" % (cab, chassis, r)
+            rtr = rtr_slot + "b0"
+            self.addHSM(rtr_slot, "RouterModule", xclass, state="On")
+            self.addHSM(rtr_slot + "e0", "HSNBoard", xclass, state="On")
+            self.addSLS(rtr, rtr_slot, "comptype_rtr_bmc", "RouterBMC", xclass)
+            self.addController(rtr, "RouterBMC", xclass)
+
+    def addMountainCabinet(self, cab):
+        self.addCabinet(cab, "Mountain")
+        for chassis in range(8):
+            self.addLiquidCooledChassis(cab, chassis, "Mountain")
+
+    def addHillCabinet(self, cab):
+        self.addCabinet(cab, "Hill", "EX2000")
+        for chassis in (1, 3):
+            self.addLiquidCooledChassis(cab, chassis, "Hill")
+
+    def addEX2500Cabinet(self, cab):
+        self.addCabinet(cab, "Hill", "EX2500")
+        for chassis in range(self.random.randint(1, 3)):
+            self.addLiquidCooledChassis(cab, chassis, "Hill")
+        self.addCabinetPDU(cab, "Hill", pdus=1)
+
+    # Fake the server side filters the scripts use.
+
+    def rfepsOfTypes(self, types):
+        return [rfep for rfep in self.redfish_endpoints if rfep["Type"] in types]
+
+    def ethernetInterfacesOfTypes(self, types):
+        return [eth for eth in self.ethernet_interfaces if eth["Type"] in types]
+
+    def slsHardwareOf(self, sls_type, xclass):
+        return [hw for hw in self.sls_hardware if hw["Type"] == sls_type and hw["Class"] == xclass]
+
+    def componentsOf(self, types, classes=None, root=None):
+        types = set(t.lower() for t in types)
+        return [comp for comp in self.hsm_components
+                if comp["Type"].lower() in types
+                and (classes is None or comp.get("Class") in classes)
+                and (root is None or xnames.isWithin(comp["ID"], root))]
+
+    def managementNodes(self):
+        return [comp for comp in self.hsm_components if comp["Type"] == "Node" and comp.get("Role") == "Management"]
+
+    def lockStatus(self, comps):
+        """The /locks/status response for a list of HSM components."""
+        return {"Components": [{"ID": comp["ID"], "Locked": comp["Locked"], "Reserved": False,
+                                "ReservationDisabled": False} for comp in comps]}
+
+    def responses(self):
+        """Return (URL, response body) for every GET the scripts make."""
+        bmc_types = ("NodeBMC", "RouterBMC")
+
+        responses = [
+            # verify_hsm_discovery.py
+            (HSM_URL + "/State/Components" + VERIFY_COMPONENT_FILTER,
+                {"Components": self.componentsOf(VERIFY_COMPONENT_TYPES)}),
+            (HSM_URL + "/Inventory/RedfishEndpoints", {"RedfishEndpoints": self.redfish_endpoints}),
+            (HSM_URL + "/Inventory/Hardware?Type=NodeEnclosure", self.node_enclosures),
+            (SLS_URL + "/hardware", self.sls_hardware),
+
+            # set_ssh_keys.py
+            (HSM_URL + "/Inventory/RedfishEndpoints" + SSH_RFEP_FILTER,
+                {"RedfishEndpoints": self.rfepsOfTypes(("ChassisBMC", "NodeBMC", "RouterBMC"))}),
+
+            # river_rf_endpoint_discovery_fixup.py
+            (HSM_URL + "/Inventory/RedfishEndpoints" + RIVER_BMC_FILTER,
+                {"RedfishEndpoints": self.rfepsOfTypes(bmc_types)}),
+            (HSM_URL + "/Inventory/EthernetInterfaces" + RIVER_BMC_FILTER,
+                self.ethernetInterfacesOfTypes(bmc_types)),
+            (SLS_URL + "/search/hardware" + RIVER_NODE_FILTER,
+                self.slsHardwareOf("comptype_node", "River")),
+
+            # lock_management_nodes.py
+            (HSM_URL + "/locks/status" + LOCK_NODE_FILTER, self.lockStatus(self.managementNodes())),
+            (HSM_URL + "/locks/status" + LOCK_BMC_FILTER, self.lockStatus(self.componentsOf(("NodeBMC",)))),
+            (HSM_URL + "/locks/status" + LOCK_ALL_NODE_FILTER, self.lockStatus(self.componentsOf(("Node",)))),
+        ]
+
+        for fltr, types, classes in SSH_BMC_FILTERS:
+            responses.append((HSM_URL + "/State/Components" + fltr,
+                              {"Components": self.componentsOf(types, classes)}))
+
+        # Queries scoped to a cabinet, verify_hsm_discovery.py --cabinet and
+        # set_ssh_keys.py --include
+        for cab in self.cabinets:
+            query = HSM_URL + "/State/Components/Query/" + cab
+            responses.append((query + VERIFY_COMPONENT_FILTER,
+                              {"Components": self.componentsOf(VERIFY_COMPONENT_TYPES, root=cab)}))
+            for fltr, types, classes in SSH_BMC_FILTERS:
+                responses.append((query + fltr, {"Components": self.componentsOf(types, classes, cab)}))
+
+        return responses
+
+    def write(self, path):
+        """Write the data as a snapshot directory."""
+        snap = snapshot.Snapshot(path)
+        for uri, data in self.responses():
+            snap.store(uri, json.dumps(data))
+
+def generate(river=1, mountain=0, hill=0, ex2500=0, seed=0, fault_rate=DEFAULT_FAULT_RATE):
+    """Generate a system with the given number of cabinets of each class."""
+    system = SyntheticSystem(seed, fault_rate)
+    for i in range(river):
+        system.addRiverCabinet("x%d" % (3000 + i), first=(i == 0))
+    for i in range(mountain):
+        system.addMountainCabinet("x%d" % (1000 + i))
+    for i in range(hill):
+        system.addHillCabinet("x%d" % (9000 + i))
+    for i in range(ex2500):
+        system.addEX2500Cabinet("x%d" % (8000 + i))
+
+    # SLS doesn't return hardware in any particular order
+    system.random.shuffle(system.sls_hardware)
+    return system
+
+# getopt long options for the system size, shared with benchmark_hms_scripts.py
+
+SIZE_OPTS = ["river=", "mountain=", "hill=", "ex2500=", "seed=", "fault-rate="]
+
+SIZE_USAGE = """   --river=N        Number of River cabinets (default 1).
+   --mountain=N     Number of Mountain cabinets (default 0).
+   --hill=N         Number of Hill (EX2000) cabinets (default 0).
+   --ex2500=N       Number of EX2500 cabinets (default 0).
+   --seed=N         Random seed (default 0).
+   --fault-rate=F   Fraction of components left undiscovered, missing RF
+                    endpoints or uncabled (default %.2f).""" % DEFAULT_FAULT_RATE
+
+def sizeFromOpts(opts):
+    """
+        Get the generate() arguments from parsed getopt options (see
+        SIZE_OPTS).  Raises ValueError on bad options.
+    """
+    size = {}
+    for opt, arg in opts:
+        if opt + "=" not in ["--" + o for o in SIZE_OPTS]:
+            continue
+        name = opt[2:].replace("-", "_")
+        try:
+            value = float(arg) if name == "fault_rate" else int(arg)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValueError("Invalid %s: '%s'" % (opt, arg))
+        size[name] = value
+    return size
+
+def usage():
+    print("Usage: %s [options] <output dir>" % sys.argv[0])
+    print(" ")
+    print(SIZE_USAGE)
+    print(" ")
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help"] + SIZE_OPTS)
+    except getopt.GetoptError:
+        usage()
+        return 1
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+
+    if len(args) != 1:
+        usage()
+        return 1
+
+    try:
+        size = sizeFromOpts(opts)
+    except ValueError as err:
+        print("ERROR: %s" % err)
+        return 1
+
+    system = generate(**size)
+    system.write(args[0])
+
+    print("Wrote %d SLS hardware entries, %d HSM components, %d RF endpoints and %d node enclosures to %s." %
+        (len(system.sls_hardware), len(system.hsm_components), len(system.redfish_endpoints),
+         len(system.node_enclosures), args[0]))
+    return 0
+
+if __name__ == "__main__":
+    ret = main()
+    sys.exit(ret)
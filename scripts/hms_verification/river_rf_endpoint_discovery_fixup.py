@@ -29,88 +29,56 @@
 """
 
 import json
-from base64 import b64decode
+import getopt
 import sys
 import os
-import time
-import requests
-from kubernetes import client, config
 
-def getK8sClient():
-    """Create a k8s client object for use in getting auth tokens."""
-    config.load_kube_config()
-    k8sClient = client.CoreV1Api()
-    return k8sClient
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from csm_common import hmsclient
+from csm_common import snapshot
+from csm_common import timings
 
-def getAuthenticationToken():
-    """Fetch auth token for HMS REST API calls."""
-    URL = "https://api-gw-service-nmn.local/keycloak/realms/shasta/protocol/openid-connect/token"
-
-    kSecret = getK8sClient().read_namespaced_secret("admin-client-auth", "default")
-    secret = b64decode(kSecret.data['client-secret']).decode("utf-8")
-
-    DATA = {
-        "grant_type": "client_credentials",
-        "client_id": "admin-client",
-        "client_secret": secret
-    }
-
-    try:
-        r = requests.post(url=URL, data=DATA)
-    except OSError:
-        return ""
-
-    result = json.loads(r.text)
-    return result['access_token']
-
-def doRest(uri, authToken):
+def doRest(hms, uri, useSnapshot=False):
     """
         Func to get a JSON payload from a URL. It's assumed to be a full URL.
-        Also note that we'll only ever be contacting HMS services.
+        Only the initial inventory fetches use the snapshot, if any, never the
+        polling for repopulated entries.  Even those only read it when
+        replaying: the entries to delete are always chosen from live data, and
+        --snapshot-cache only saves it.
     """
-    getHeaders = {'Authorization': 'Bearer %s' % authToken,}
-    r = requests.get(url=uri, headers=getHeaders)
-    retJSON = r.text
-
-    if r.status_code >= 300:
-        stat = 1
-    else:
-        stat = 0
+    return hms.get(uri, useSnapshot, refresh=True)
 
-    return retJSON, stat
-
-def getHSMRFEP(authToken, fltr):
+def getHSMRFEP(hms, fltr, useSnapshot=False):
     """Get HSM RFEP data"""
     url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/RedfishEndpoints" + fltr
-    rfepJSON, rstat = doRest(url, authToken)
+    rfepJSON, rstat = doRest(hms, url, useSnapshot)
+    if rstat != 0:
+        return {}, rstat
     rfepData = json.loads(rfepJSON)
     return rfepData, rstat
 
-def getHSMEthData(authToken, fltr):
+def getHSMEthData(hms, fltr, useSnapshot=False):
     """Get HSM EthernetInterfaces data"""
     url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/EthernetInterfaces" + fltr
-    ethJSON, rstat = doRest(url, authToken)
+    ethJSON, rstat = doRest(hms, url, useSnapshot)
+    if rstat != 0:
+        return [], rstat
     ethData = json.loads(ethJSON)
     return ethData, rstat
 
-def getSLSData(authToken, fltr):
+def getSLSData(hms, fltr, useSnapshot=False):
     """Get HSM RFEP data"""
     url = "https://api-gw-service-nmn.local/apis/sls/v1/search/hardware" + fltr
-    rfepJSON, rstat = doRest(url, authToken)
+    rfepJSON, rstat = doRest(hms, url, useSnapshot)
+    if rstat != 0:
+        return [], rstat
     rfepData = json.loads(rfepJSON)
     return rfepData, rstat
 
-def doHSMEthDelete(authToken, ethID):
+def doHSMEthDelete(hms, ethID):
     """Delete a EthernetInterfaces entry from HSM by ethernet ID"""
     uri = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/EthernetInterfaces/" + ethID
-    getHeaders = {'Authorization': 'Bearer %s' % authToken,}
-    r = requests.delete(url=uri, headers=getHeaders)
-    if r.status_code >= 300:
-        stat = 1
-    else:
-        stat = 0
-
-    return stat
+    return hms.delete(uri)
 
 def doPing(host):
     """Ping the specified host"""
@@ -119,12 +87,15 @@ def doPing(host):
         return True
     return False
 
-def genBMCList(rfepData, ethData, slsData):
+def genBMCList(rfepData, ethData, slsData, pingCheck=True):
     """
         Generate a list of BMCs that have EthernetInterface entries but not
-        RedfishEndpoint entries in HSM and are pingable.
+        RedfishEndpoint entries in HSM and are pingable.  The ping check is
+        skipped if pingCheck is False.
     """
     bmcList = []
+    rfepIDs = set(rfep['ID'] for rfep in rfepData['RedfishEndpoints'])
+    riverBMCs = set(node['Parent'] for node in slsData)
 
     for eth in ethData:
         if len(eth['IPAddresses']) > 0 and len(eth['IPAddresses'][0]) > 0:
@@ -134,38 +105,36 @@ def genBMCList(rfepData, ethData, slsData):
 
         # Check RF Endpoints presence. Only care about when the
         # BMC doesn't have a redfishEndpoint entry.
-        rfeps = rfepData['RedfishEndpoints']
-        filtered = list(filter(lambda rfep, e=eth: (rfep['ID'] == e['ComponentID']), rfeps))
-        if len(filtered) > 0:
+        if eth['ComponentID'] in rfepIDs:
             continue
 
         # Filter out non-river components
-        filtered = list(filter(lambda c, e=eth: (c['Parent'] == e['ComponentID']), slsData))
-        if not filtered:
+        if eth['ComponentID'] not in riverBMCs:
             continue
 
-        isPingable = doPing(eth['ComponentID'])
-        if not isPingable:
-            continue
+        if pingCheck:
+            isPingable = doPing(eth['ComponentID'])
+            if not isPingable:
+                continue
 
         bmcList.append(eth)
 
     return bmcList
 
-def deleteHSMEthEntries(authToken, bmcList):
+def deleteHSMEthEntries(hms, bmcList):
     """Delete all the EthernetInterfaces entries for the specified BMCs"""
     failList = []
     passList = []
 
     for bmc in bmcList:
-        stat = doHSMEthDelete(authToken, bmc['ID'])
+        stat = doHSMEthDelete(hms, bmc['ID'])
         if stat != 0:
             failList.append(bmc)
         else:
             passList.append(bmc)
     return passList, failList
 
-def waitForHSMEthEntries(authToken, bmcList):
+def waitForHSMEthEntries(hms, bmcList):
     """Waits for the EthernetInterfaces entries for the specified BMCs to be repopulated."""
     failList = []
     passList = []
@@ -179,8 +148,8 @@ def waitForHSMEthEntries(authToken, bmcList):
 
     for retry in range(5):
         print("%d: Waiting for EthernetInterfaces to be repopulated..." % retry)
-        time.sleep(60)
-        ethData, stat = getHSMEthData(authToken, fltr)
+        hms.timings.sleep(60)
+        ethData, stat = getHSMEthData(hms, fltr)
         if stat != 0:
             continue
 
@@ -196,7 +165,7 @@ def waitForHSMEthEntries(authToken, bmcList):
                 passList.append(bmc)
     return passList, failList
 
-def waitForHSMRFEPs(authToken, bmcList):
+def waitForHSMRFEPs(hms, bmcList):
     """
         Waits for the RedfishEndpoints entries for the specified
         BMCs to be repopulated by hms-discovery.
@@ -213,8 +182,8 @@ def waitForHSMRFEPs(authToken, bmcList):
 
     for retry in range(5):
         print("%d: Waiting for RedfishEndpoints to be repopulated..." % retry)
-        time.sleep(60)
-        rfepData, stat = getHSMRFEP(authToken, fltr)
+        hms.timings.sleep(60)
+        rfepData, stat = getHSMRFEP(hms, fltr)
         if stat != 0:
             continue
 
@@ -275,38 +244,82 @@ def genSummary(bmcList, deleteFailList, ethTimeoutList, rfepTimeoutList):
 
     print("")
 
+def usage():
+    print("Usage: %s [options]" % sys.argv[0])
+    print(" ")
+    print(snapshot.USAGE)
+    print("                         Reports the BMCs that would be fixed, without")
+    print("                         the ping check, and doesn't fix them.")
+    print("                         --snapshot-cache saves the data fetched but")
+    print("                         doesn't reuse it; what to fix is always decided")
+    print("                         from live data.")
+    print(timings.USAGE)
+    print(" ")
+
 def errorGuidance():
     print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/troubleshooting/known_issues/discovery_job_not_creating_redfish_endpoints.md\n")
 
 def main():
     """Entry point"""
+
     numErrs = 0
-    authToken = getAuthenticationToken()
-    if authToken == "":
-        print("ERROR: No/empty auth token, can't continue.")
-        print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md\n")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help"] + snapshot.LONG_OPTS + timings.LONG_OPTS)
+    except getopt.GetoptError:
+        usage()
         return 1
 
-    rfepData, stat = getHSMRFEP(authToken, "?type=nodeBMC&type=routerBMC")
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+
+    try:
+        dataSnapshot = snapshot.fromOpts(opts)
+    except ValueError as err:
+        print("ERROR: %s" % err)
+        return 1
+    timer = timings.fromOpts(opts)
+    hms = hmsclient.HMSClient(dataSnapshot, timings=timer)
+    replay = hms.replay
+
+    if not replay:
+        with timer.phase("auth"):
+            token = hms.authenticate()
+        if token == "":
+            print("ERROR: No/empty auth token, can't continue.")
+            print("\nFor troubleshooting and manual steps, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/security_and_authentication/Retrieve_an_Authentication_Token.md\n")
+            return 1
+
+    with timer.phase("fetch RedfishEndpoints"):
+        rfepData, stat = getHSMRFEP(hms, "?type=nodeBMC&type=routerBMC", useSnapshot=True)
     if stat != 0:
         print("HSM RedfishEndpoints returned non-zero.")
         errorGuidance()
         return 1
 
-    ethData, stat = getHSMEthData(authToken, "?type=nodeBMC&type=routerBMC")
+    with timer.phase("fetch EthernetInterfaces"):
+        ethData, stat = getHSMEthData(hms, "?type=nodeBMC&type=routerBMC", useSnapshot=True)
     if stat != 0:
         print("HSM EthernetInterfaces returned non-zero.")
         errorGuidance()
         return 1
 
-    slsData, stat = getSLSData(authToken, "?type=comptype_node&class=River")
+    with timer.phase("fetch SLS hardware"):
+        slsData, stat = getSLSData(hms, "?type=comptype_node&class=River", useSnapshot=True)
     if stat != 0:
         print("HSM EthernetInterfaces returned non-zero.")
         errorGuidance()
         return 1
 
-    bmcList = genBMCList(rfepData, ethData, slsData)
-    if len(bmcList) > 0:
+    with timer.phase("select"):
+        bmcList = genBMCList(rfepData, ethData, slsData, pingCheck=not replay)
+    if len(bmcList) > 0 and replay:
+        print("Replaying snapshot %s, not fixing." % dataSnapshot.path)
+        print("Found %d river BMCs that may need fixing:" % len(bmcList))
+        print(genIDStr(bmcList))
+    elif len(bmcList) > 0:
         deleteFailList = []
         ethTimeoutList = []
         rfepTimeoutList = []
@@ -315,13 +328,16 @@ def main():
             bmcStr = genIDStr(bmcList)
             print(bmcStr)
             print("Deleting %d EthernetInterfaces entries for HSM" % len(bmcList))
-            bmcList, deleteFailList = deleteHSMEthEntries(authToken, bmcList)
+            with timer.phase("delete"):
+                bmcList, deleteFailList = deleteHSMEthEntries(hms, bmcList)
             if len(bmcList) == 0:
                 break
-            bmcList, ethTimeoutList = waitForHSMEthEntries(authToken, bmcList)
+            with timer.phase("wait EthernetInterfaces"):
+                bmcList, ethTimeoutList = waitForHSMEthEntries(hms, bmcList)
             if len(bmcList) == 0:
                 break
-            bmcList, rfepTimeoutList = waitForHSMRFEPs(authToken, bmcList)
+            with timer.phase("wait RedfishEndpoints"):
+                bmcList, rfepTimeoutList = waitForHSMRFEPs(hms, bmcList)
             break
         genSummary(bmcList, deleteFailList, ethTimeoutList, rfepTimeoutList)
         numErrs = len(deleteFailList) + len(ethTimeoutList) + len(rfepTimeoutList)
@@ -23,15 +23,22 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 
-import json
-from base64 import b64decode
-import requests
-from kubernetes import client, config
-import re
-import string
+import os
+import sys
+import getopt
+import time
+from concurrent.futures import ThreadPoolExecutor
 from itertools import groupby
 from operator import itemgetter
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from csm_common.records import HSMComponent, SLSHardware
+from csm_common import hmsclient
+from csm_common import metrics as promMetrics
+from csm_common import snapshot
+from csm_common import timings
+from csm_common import xnames
+
 ##############################################################################
 # Generate per-cabinet details containing info on nodes, NodeBMCs, RouterBMCs,
 # CabinetPDUControllers.   A Higher level func will do these by type -- river,
@@ -106,26 +113,17 @@ for node_topology in expected_node_topology:
         expected_node_topology_by_model[model] = node_topology
 
 # Retrieve the corresponding node topology object for the given slot if it exists.
-def getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureInventoryData):
+# nodeEnclosureModels maps NodeEnclosure xnames to their model, see
+# getHSMInventoryHardwareForNodeEnclosures().
+def getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureModels):
     node_enclosure_xname = slot_xname + "e0"
-    
-    # Determine the current model for this slot. Need to check that each key exists, as it's not guaranteed
-    # to exist
-    if node_enclosure_xname not in nodeEnclosureInventoryData:
-        return None
-    node_enclosure_data = nodeEnclosureInventoryData[node_enclosure_xname]
-    
-    if "PopulatedFRU" not in node_enclosure_data:
-        return None
-    
-    if "NodeEnclosureFRUInfo" not in node_enclosure_data["PopulatedFRU"]:
-        return None
 
-    if "Model" not in  node_enclosure_data["PopulatedFRU"]["NodeEnclosureFRUInfo"]:
+    # Determine the current model for this slot, it is not guaranteed to exist
+    model = nodeEnclosureModels.get(node_enclosure_xname)
+    if model is None:
         return None
-        
+
     # Check to see if know about this node model
-    model = node_enclosure_data["PopulatedFRU"]["NodeEnclosureFRUInfo"]["Model"]
     if model not in expected_node_topology_by_model:
         # print(f"{slot_xname} Model: {model} not found!")
         return None
@@ -133,8 +131,8 @@ def getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureInventoryData):
     return expected_node_topology_by_model[model]
 
 # Retrieve the expected nodes BMCs that should be present in the slot if node topology data exists.
-def getExpectedNodeBMCsForSlot(slot_xname, nodeEnclosureInventoryData):
-    expected_node_topology = getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureInventoryData)
+def getExpectedNodeBMCsForSlot(slot_xname, nodeEnclosureModels):
+    expected_node_topology = getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureModels)
     if expected_node_topology is None:
         return None
 
@@ -145,8 +143,8 @@ def getExpectedNodeBMCsForSlot(slot_xname, nodeEnclosureInventoryData):
     return bmc_xnames
 
 # Retrieve the expected nodes that should be present in the slot if node topology data exists.
-def getExpectedNodesForSlot(slot_xname, nodeEnclosureInventoryData):
-    expected_node_topology = getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureInventoryData)
+def getExpectedNodesForSlot(slot_xname, nodeEnclosureModels):
+    expected_node_topology = getExpectedNodeTopologyForSlot(slot_xname, nodeEnclosureModels)
     if expected_node_topology is None:
         return None
 
@@ -164,149 +162,246 @@ class CabInfo():
         self.xclass = xc
         self.model = model
 
-# Create a k8s client object for use in getting auth tokens.
+# Check profiles for each class of cabinet.  Each cabinet is checked with the
+# first profile whose selector matches it, and the report has a section for
+# each profile, in this order.
 
-def getK8sClient():
-    config.load_kube_config()
-    k8sClient = client.CoreV1Api()
-    return k8sClient
+cabinet_check_profiles = [
+    {
+        "Title": "River Cabinet Checks",
+        "Selector": lambda cab: cab.xclass == "River",
+        "CheckRiverSpecificHardware": True,
+        "CheckMountainSpecificHardware": False
+    },
+    {
+        "Title": "Mountain/Hill Cabinet Checks",
+        "Selector": lambda cab: cab.xclass == "Mountain" or (cab.xclass == "Hill" and cab.model != "EX2500"),
+        "CheckRiverSpecificHardware": False,
+        "CheckMountainSpecificHardware": True
+    },
+    {
+        "Title": "EX2500 Cabinet Checks",
+        "Selector": lambda cab: cab.xclass == "Hill" and cab.model == "EX2500",
+        "CheckRiverSpecificHardware": True,
+        "CheckMountainSpecificHardware": True
+    }
+]
 
-# Fetch auth token for HMS REST API calls.
+# Data structure to contain the inventory data the checks use.
 
-def getAuthenticationToken():
-    URL = "https://api-gw-service-nmn.local/keycloak/realms/shasta/protocol/openid-connect/token"
+class CheckData():
+    def __init__(self, sls_index, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures):
+        self.sls_index = sls_index
+        self.hsm_state_components = hsm_state_components
+        self.hsm_redfish_endpoints = hsm_redfish_endpoints
+        self.hsm_inventory_node_enclosures = hsm_inventory_node_enclosures
 
-    kSecret = getK8sClient().read_namespaced_secret("admin-client-auth", "default")
-    secret = b64decode(kSecret.data['client-secret']).decode("utf-8")
+# Route each cabinet to its check profile with a single pass over the
+# cabinets.  Returns a list of cabinets for each profile, in profile order,
+# keeping the order of the given cabinets.
 
-    DATA = {
-        "grant_type": "client_credentials",
-        "client_id": "admin-client",
-        "client_secret": secret
-    }
+def classifyCabinets(cabinets):
+    cabinets_by_profile = [[] for profile in cabinet_check_profiles]
+    for cab in cabinets:
+        for i, profile in enumerate(cabinet_check_profiles):
+            if profile["Selector"](cab):
+                cabinets_by_profile[i].append(cab)
+                break
 
-    try:
-        r = requests.post(url=URL, data=DATA)
-    except OSError:
-        return ""
+    return cabinets_by_profile
+
+# Number of the HSM and SLS datasets fetched at once.
+
+FETCH_WORKERS = 4
+
+HSM_URL = "https://api-gw-service-nmn.local/apis/smd/hsm/v2"
+SLS_URL = "https://api-gw-service-nmn.local/apis/sls/v1"
 
-    result = json.loads(r.text)
-    return result['access_token']
+# The HSM component types the summary and the checks look at.  Only these are
+# fetched, HSM leaves out everything else (PDU outlets, enclosures, HSN boards,
+# ...) on the server side.
 
-# Func to get a JSON payload from a URL.  It's assumed to be a full URL.
-# Also note that we'll only ever be contacting HMS services.
+HSM_COMPONENT_TYPES = ["Node", "NodeBMC", "RouterBMC", "ChassisBMC", "CabinetPDUController",
+                       "ComputeModule", "RouterModule"]
+HSM_COMPONENT_FILTER = "?type=" + "&type=".join(HSM_COMPONENT_TYPES)
 
-def doRest(uri, authToken):
-    getHeaders = {'Authorization': 'Bearer %s' % authToken,}
-    r = requests.get(url=uri, headers=getHeaders)
-    retJSON = r.text
+# True if an xname is in one of the given cabinets, or there is no cabinet
+# scope.
 
-    if r.status_code >= 300:
-        ret = 1
+def inScope(xname, cabinets):
+    return cabinets is None or xnames.cabinet(xname) in cabinets
+
+# Get HSM component data, as a map of component ID to HSMComponent records.
+# With a cabinet scope each cabinet's components are queried from HSM on their
+# own.
+
+def getHSMComponents(hms, cabinets=None):
+    if cabinets is None:
+        urls = [HSM_URL + "/State/Components" + HSM_COMPONENT_FILTER]
     else:
-        ret = 0
+        urls = [HSM_URL + "/State/Components/Query/" + cab + HSM_COMPONENT_FILTER for cab in sorted(cabinets)]
+    comps = {}
+
+    def addComponent(component):
+        comps[component["ID"]] = HSMComponent.fromJSON(component)
+
+    for url in urls:
+        rstat = hms.stream(url, addComponent, key="Components")
+        if rstat != 0:
+            return comps, rstat
+    return comps, 0
+
+
+
+# Get HSM RFEP data, as a set of RedfishEndpoint IDs.  HSM can't filter
+# RedfishEndpoints by cabinet, so a cabinet scope is applied as they're read.
+
+def getHSMRFEP(hms, cabinets=None):
+    url = HSM_URL + "/Inventory/RedfishEndpoints"
+    rfeps = set()
+
+    def addRFEP(redfish_endpoint):
+        if inScope(redfish_endpoint["ID"], cabinets):
+            rfeps.add(redfish_endpoint["ID"])
+
+    rstat = hms.stream(url, addRFEP, key="RedfishEndpoints")
+    return rfeps, rstat
+
+# Get HSM Hardware Inventory data for nodes, as a map of NodeEnclosure ID to
+# its model.  Enclosures without a known model are left out.  As with the
+# RFEPs, a cabinet scope is applied as they're read.
 
-    return retJSON, ret
+def getHSMInventoryHardwareForNodeEnclosures(hms, cabinets=None):
+    url = HSM_URL + "/Inventory/Hardware?Type=NodeEnclosure"
+    models = {}
 
+    def addNodeEnclosure(node_enclosure):
+        fru_info = node_enclosure.get("PopulatedFRU", {}).get("NodeEnclosureFRUInfo", {})
+        if "Model" in fru_info and inScope(node_enclosure["ID"], cabinets):
+            models[node_enclosure["ID"]] = fru_info["Model"]
 
-# Get HSM component data
+    rstat = hms.stream(url, addNodeEnclosure)
+    return models, rstat
 
-def getHSMComponents(authToken):
-    url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/State/Components"
-    compsJSON, rstat = doRest(url, authToken)
-    return compsJSON, rstat
+# Get SLS HW data, indexed as it's read.  SLS has no way to search by cabinet
+# (parent only matches direct children), so the index applies a cabinet scope.
 
+def getSLSHWData(hms, cabinets=None):
+    url = SLS_URL + "/hardware"
+    sls_index = SLSHardwareIndex(cabinets=cabinets)
+    rstat = hms.stream(url, sls_index.add)
+    return sls_index, rstat
 
+# Fetch the HSM component, HSM RFEP, HSM node enclosure and SLS hardware data,
+# for all cabinets or only the given set of cabinets.  None of these depend on
+# each other so they are fetched concurrently; the results are returned in that
+# order as (JSON, status) tuples.
 
-# Get HSM RFEP data
+def getInventoryData(hms, cabinets=None):
+    fetchers = [
+        getHSMComponents,
+        getHSMRFEP,
+        getHSMInventoryHardwareForNodeEnclosures,
+        getSLSHWData,
+    ]
 
-def getHSMRFEP(authToken):
-    url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/RedfishEndpoints"
-    rfepJSON, rstat = doRest(url, authToken)
-    return rfepJSON, rstat
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = [executor.submit(fetcher, hms, cabinets) for fetcher in fetchers]
+        return [future.result() for future in futures]
 
-# Get HSM Hardware Inventory data for nodes
 
-def getHSMInventoryHardwareForNodeEnclosures(authTokens):
-    url = "https://api-gw-service-nmn.local/apis/smd/hsm/v2/Inventory/Hardware?Type=NodeEnclosure"
-    rfepJSON, rstat = doRest(url, authTokens)
-    return rfepJSON, rstat
+# Index of the SLS hardware data.  This is built with a single pass over the
+# SLS hardware and groups the components by TypeString and by the cabinet they
+# live in, so the per-cabinet checks only ever look at their own hardware
+# instead of re-filtering the entire SLS hardware list for every cabinet.  With
+# a set of cabinets, hardware outside them is left out.
 
-# Get SLS HW data
+SLS_INDEXED_TYPES = ["Node", "RouterBMC", "ChassisBMC", "CabinetPDUController"]
 
-def getSLSHWData(authToken):
-    url = "https://api-gw-service-nmn.local/apis/sls/v1/hardware"
-    slsJSON, rstat = doRest(url, authToken)
-    return slsJSON, rstat
+class SLSHardwareIndex():
+    def __init__(self, sls_hardware=(), cabinets=None):
+        self.scope = cabinets
+        # List of cabinets and their type (RV,MT,HILL).
+        self.cabinets = []
+        # Cabinet xname -> TypeString -> list of components
+        self.byCabinet = {}
+        # Cabinet xname -> list of Gigabyte CMCs (b999)
+        self.cmcsByCabinet = {}
+        # BMC xname -> list of connected mgmt switch ports (from NodeNics)
+        self.mgmtPortsByBMC = {}
 
+        for comp in sls_hardware:
+            self.add(comp)
 
-# Returns a list of cabinets and their type (RV,MT,HILL).
-# This is taken from the SLS data.
+    def getSortedCabinets(self):
+        """Return the cabinets sorted by cab num."""
+        return sorted(self.cabinets, key=lambda cab: cab.xname)
 
-def getCabList(sls_hardware):
-    cabList = []
+    def add(self, comp):
+        ctype = comp['TypeString']
 
-    for comp in sls_hardware:
-        if comp['TypeString'] == "Cabinet":
+        if ctype == "Cabinet" and inScope(comp['Xname'], self.scope):
             model = None
             if "Model" in comp['ExtraProperties']:
                 model = comp['ExtraProperties']['Model']
-            cabList.append(CabInfo(comp['Xname'], comp['Class'], model))
+            self.cabinets.append(CabInfo(comp['Xname'], comp['Class'], model))
 
-    return cabList
+        if "ExtraProperties" in comp and "NodeNics" in comp['ExtraProperties']:
+            # The switch may be in another cabinet than the BMCs it connects
+            for nic in comp['ExtraProperties']['NodeNics']:
+                if inScope(nic, self.scope):
+                    self.mgmtPortsByBMC.setdefault(nic, []).append(comp['Xname'])
 
+        is_cmc = comp['Xname'].endswith("b999")
+        if ctype not in SLS_INDEXED_TYPES and not is_cmc:
+            return
 
-# Given a BMC, return a list of connected mgmt port NICs.
+        cab_xname = xnames.cabinet(comp['Xname'])
+        if cab_xname is None or not inScope(cab_xname, self.scope):
+            return
 
-def findNodeNics(bmc, sls_hardware):
-    nics = []
-    for comp in sls_hardware:
-        if not "ExtraProperties" in comp:
-            continue
+        # Only keep the fields the checks use
+        comp = SLSHardware.fromJSON(comp)
 
-        if not "NodeNics" in comp['ExtraProperties']:
-            continue
+        if ctype in SLS_INDEXED_TYPES:
+            self.byCabinet.setdefault(cab_xname, {}).setdefault(ctype, []).append(comp)
+        if is_cmc:
+            self.cmcsByCabinet.setdefault(cab_xname, []).append(comp)
+
+    def getComponents(self, cab_xname, ctype):
+        """Return the SLS components of the given TypeString in a cabinet."""
+        return self.byCabinet.get(cab_xname, {}).get(ctype, [])
 
-        for nic in comp['ExtraProperties']['NodeNics']:
-            if nic == bmc:
-                nics.append(comp['Xname'])
+    def getCMCs(self, cab_xname):
+        """Return the Gigabyte CMCs (b999) in a cabinet."""
+        return self.cmcsByCabinet.get(cab_xname, [])
 
-    return nics
 
-# Xname helpers
-def get_component_parent(xname:str):
-    regex_cdu = "^d([0-9]+)$"
-    regex_cabinet = "^x([0-9]{1,4})$"
-    if re.match(regex_cdu, xname) is not None or re.match(regex_cabinet, xname) is not None:
-        # Parent of Cabinets and CDUs is the System s0
-        return "s0"
+# Given a BMC, return a list of connected mgmt port NICs.
 
-    # Trim all trailing numbers, then in the result, trim all trailing
-    # letters.
-    return xname.rstrip(string.digits).rstrip(string.ascii_letters)
+def findNodeNics(bmc, sls_index):
+    return sls_index.mgmtPortsByBMC.get(bmc, [])
 
 # Convenience function, checks SLS components to see if they are present in
 # HSM component data, HSM RedfishEndpoint data, and if there is a mgmt port
 # associated with it in SLS.  Returns a message with relevant info.
 
-def doChecks(xclass, comp, bname, ctype, hsm_state_components, hsm_redfish_endpoints, sls_hardware):
+def doChecks(xclass, comp, bname, ctype, hsm_state_components, hsm_redfish_endpoints, sls_index):
     noc = ""
 
     # Check state components presence
-    filtered = list(filter(lambda f: (f['ID'] == bname), hsm_state_components.values()))
-    if not filtered:
+    if bname not in hsm_state_components:
         noc = "Not found in HSM Components"
 
     # Check RF Endpoints presence
-    filtered = list(filter(lambda f: (f['ID'] == bname), hsm_redfish_endpoints.values()))
-    if not filtered:
+    if bname not in hsm_redfish_endpoints:
         if len(noc) > 0:
             noc += "; "
         noc += "Not found in HSM Redfish Endpoints"
 
     if xclass == "River":
         # Check mgmt port connection
-        filtered = findNodeNics(bname, sls_hardware)
+        filtered = findNodeNics(bname, sls_index)
         if not filtered:
             if len(noc) > 0:
                 noc += "; "
@@ -315,23 +410,41 @@ def doChecks(xclass, comp, bname, ctype, hsm_state_components, hsm_redfish_endpo
                 # Check if this is a mgmt NCN, if so, print alias.  This is
                 # determined by looking at the Role -- look for Management.
                 # Then, grab the ExtraProperties/Aliases.
-                if comp['ExtraProperties']['Role'] == "Management":
-                    noc += "; BMC of mgmt node " + comp['ExtraProperties']['Aliases'][0]
+                if comp.role == "Management":
+                    noc += "; BMC of mgmt node " + comp.aliases[0]
 
     return noc
 
+# Discovered component counts for a cabinet, from genSummary().
+
+class CabSummary():
+    def __init__(self, cab, components, nodeRoles, moduleSlots):
+        self.cab = cab
+        # Components by type, with CMCs counted as "CMC" rather than NodeBMC
+        self.components = components
+        # Nodes by role
+        self.nodeRoles = nodeRoles
+        # Slots by (module type, "Populated" or "Empty")
+        self.moduleSlots = moduleSlots
+
 # Generate a per-cabinet summary containing numbers of nodes, BMCs, etc.
 # This needs to be gotten from HSM component data.  TODO: should we be using
-# the RF endpoints instead?
+# the RF endpoints instead?  Returns a CabSummary for each cabinet.
 
-def genSummary(sls_hardware, hsm_state_components):
-    cabList = getCabList(sls_hardware)
-    # Sort by cab num
-    clSorted = sorted(cabList, key=lambda cab: cab.xname)
+def genSummary(clSorted, hsm_state_components):
+
+    # Group the HSM components by cabinet up front so each cabinet only looks
+    # at its own components.
+    hsm_components_by_cabinet = {}
+    for comp in hsm_state_components.values():
+        cab_xname = xnames.cabinet(comp.xname)
+        if cab_xname is not None:
+            hsm_components_by_cabinet.setdefault(cab_xname, []).append(comp)
 
     print("HSM Cabinet Summary")
     print("===================")
 
+    summaries = []
     for cab in clSorted:
         nodes = 0
         nodebmcs = 0
@@ -348,20 +461,17 @@ def genSummary(sls_hardware, hsm_state_components):
         routerModuleSlotsPopulated = 0
         routerModuleSlotsEmpty = 0
 
-        for comp in hsm_state_components.values():
-            if not comp['ID'].startswith(cab.xname):
-                continue
-
-            ctype = comp['Type']
+        for comp in hsm_components_by_cabinet.get(cab.xname, []):
+            ctype = comp.type
             if ctype == "Node":
                 nodes += 1
-                if comp['Role'] == "Compute":
+                if comp.role == "Compute":
                     compNodes += 1
-                elif comp['Role'] == "Management":
+                elif comp.role == "Management":
                     mgmtNodes += 1
-                elif comp['Role'] == "Application":
+                elif comp.role == "Application":
                     appNodes += 1
-            elif ctype == "NodeBMC" and comp['ID'].endswith("b999"):
+            elif ctype == "NodeBMC" and comp.xname.endswith("b999"):
                 cmcs += 1
             elif ctype == "NodeBMC":
                 nodebmcs += 1
@@ -372,12 +482,12 @@ def genSummary(sls_hardware, hsm_state_components):
             elif ctype == "CabinetPDUController":
                 cabpducontrollers += 1
             elif ctype == "ComputeModule":
-                if comp["State"] == "Empty":
+                if comp.state == "Empty":
                     computeModuleSlotsEmpty += 1
                 else:
                     computeModuleSlotsPopulated += 1
             elif ctype == "RouterModule":
-                if comp["State"] == "Empty":
+                if comp.state == "Empty":
                     routerModuleSlotsEmpty  += 1
                 else:
                     routerModuleSlotsPopulated += 1
@@ -406,317 +516,478 @@ def genSummary(sls_hardware, hsm_state_components):
             print("    Populated: %3d" % (routerModuleSlotsPopulated))
             print("    Empty:     %3d" % (routerModuleSlotsEmpty))
 
-    print("")
+        summaries.append(CabSummary(cab,
+            {"Node": nodes, "NodeBMC": nodebmcs, "CMC": cmcs, "RouterBMC": rtrbmcs,
+             "ChassisBMC": chassisbmcs, "CabinetPDUController": cabpducontrollers},
+            {"Management": mgmtNodes, "Application": appNodes, "Compute": compNodes},
+            {("ComputeModule", "Populated"): computeModuleSlotsPopulated,
+             ("ComputeModule", "Empty"): computeModuleSlotsEmpty,
+             ("RouterModule", "Populated"): routerModuleSlotsPopulated,
+             ("RouterModule", "Empty"): routerModuleSlotsEmpty}))
 
+    print("")
+    return summaries
 
-def genCabinetDetails(sls_hardware, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures, cabinet_selector, check_river_specific_hardware=False, check_mountain_specific_hardware=False):
-    numErrs = 0
-
-    cabList = getCabList(sls_hardware)
-    # Sort by cab num
-    clSorted = sorted(cabList, key=lambda cab: cab.xname)
 
-    numCabs = 0
-    for cab in clSorted:
-        # Check to see if this cabinet should be checked
-        if not cabinet_selector(cab):
-            continue
+# Run the checks for a single cabinet.  The report lines are returned rather
+# than printed so cabinets can be checked in parallel; returns the lines, the
+# number of errors found and a (check, number of problems) tuple for each
+# check run, in report order.  A check with problems is reported as FAIL, but
+# only some of them count as errors.
 
-        numCabs += 1
+def checkCabinet(check_data, cab, check_river_specific_hardware=False, check_mountain_specific_hardware=False):
+    sls_index = check_data.sls_index
+    hsm_state_components = check_data.hsm_state_components
+    hsm_redfish_endpoints = check_data.hsm_redfish_endpoints
+    hsm_inventory_node_enclosures = check_data.hsm_inventory_node_enclosures
 
-        cabinet_description = cab.xclass
-        if cab.model is not None:
-            cabinet_description += " - " + cab.model
-        print("%s (%s)" % (cab.xname, cabinet_description))
+    numErrs = 0
+    out = []
+    checks = []
 
-        if check_mountain_specific_hardware:
-            #
-            # Chassis BMCs
-            #
-
-            # Check ChassisBMCs.  All 8 must be present in each cabinet for
-            # Mountain (EX3000/EX4000), c1 and c3 must be present for Hill 
-            # EX2000, and EX2500 cabinets can have 1, 2 or 3.
-            # NOTE!!!  
-            # It is assumed that the SLS data contains all requisite ChassisBMCs 
-            # and this app does not have to verify the counts or e.g. that c1 
-            # and c3 are both present in SLS for Hill (EX2000).
-
-            errs = []
-            chassis_bmcs = list(filter(lambda f: (f['TypeString'] == "ChassisBMC"), sls_hardware))
-            for chassis_bmc in chassis_bmcs:
-                chassis_bmc_xname = chassis_bmc["Xname"]
-
-                error_msgs = []
-
-                # Check state components presence
-                if chassis_bmc_xname not in hsm_state_components:
-                    error_msgs.append("Not found in HSM Components")
-
-                # Check RF Endpoints presence
-                if chassis_bmc_xname not in hsm_redfish_endpoints:
-                    error_msgs.append("Not found in HSM Redfish Endpoints")
-
-                if len(error_msgs) > 0:
-                    errs.append("- %s - %s." % (chassis_bmc_xname, '; '.join(error_msgs)))
-
-            # Print out the Chassis BMC info.
-            if not errs:
-                print("  ChassisBMCs: PASS")
-            else:
-                numErrs += 1
-                print("  ChassisBMCs: FAIL")
-                for emsg in errs:
-                    print("    %s" % (emsg))
+    cabinet_description = cab.xclass
+    if cab.model is not None:
+        cabinet_description += " - " + cab.model
+    out.append("%s (%s)" % (cab.xname, cabinet_description))
 
+    if check_mountain_specific_hardware:
         #
-        # Nodes
+        # Chassis BMCs
         #
 
-        # Check Nodes.  Missing == WARNING.
+        # Check ChassisBMCs.  All 8 must be present in each cabinet for
+        # Mountain (EX3000/EX4000), c1 and c3 must be present for Hill 
+        # EX2000, and EX2500 cabinets can have 1, 2 or 3.
+        # NOTE!!!  
+        # It is assumed that the SLS data contains all requisite ChassisBMCs 
+        # and this app does not have to verify the counts or e.g. that c1 
+        # and c3 are both present in SLS for Hill (EX2000).
 
-        # Iterate all nodes in SLS.  Check for not present in comps/rfeps,
-        # mgmt ports.  Any missing/mismatch is a FAIL.
         errs = []
-        nodes = list(filter(lambda f: (f['TypeString'] == "Node"), sls_hardware))
-        for node in nodes:
-            node_xname = node['Xname']
-            if not node_xname.startswith(cab.xname):
-                continue
-
-            if node_xname not in hsm_state_components:
-                # Check to see if the slot is populated
-                bmc_xname = get_component_parent(node_xname)
-                slot_xname = get_component_parent(bmc_xname)
+        chassis_bmcs = sls_index.getComponents(cab.xname, "ChassisBMC")
+        for chassis_bmc in chassis_bmcs:
+            chassis_bmc_xname = chassis_bmc.xname
 
-                # Ignore empty slots
-                if slot_xname in hsm_state_components and hsm_state_components[slot_xname]["State"] == "Empty":
-                    continue
+            error_msgs = []
 
-                # Check to see if this node is expected to be present based on the node enclosure
-                expected_bmcs = getExpectedNodesForSlot(slot_xname, hsm_inventory_node_enclosures)
-                if expected_bmcs is not None:
-                    if bmc_xname not in expected_bmcs:
-                        continue
+            # Check state components presence
+            if chassis_bmc_xname not in hsm_state_components:
+                error_msgs.append("Not found in HSM Components")
 
-                # Not all nodes have NIDs, so check for that.
-                nidStr = "N/A"
-                if "NID" in node['ExtraProperties']:
-                    nidStr = "%d" % (node['ExtraProperties']['NID'])
-                aliasString = "N/A"
-                if "Aliases" in node['ExtraProperties']:
-                    aliasString = ", ".join(node['ExtraProperties']["Aliases"])
+            # Check RF Endpoints presence
+            if chassis_bmc_xname not in hsm_redfish_endpoints:
+                error_msgs.append("Not found in HSM Redfish Endpoints")
 
-                errs.append("- %s (%s, NID %s, Alias %s) - Not found in HSM Components." %
-                    (node_xname, node['ExtraProperties']['Role'], nidStr, aliasString))
+            if len(error_msgs) > 0:
+                errs.append("- %s - %s." % (chassis_bmc_xname, '; '.join(error_msgs)))
 
-        # Print out the node info.
+        # Print out the Chassis BMC info.
+        checks.append(("ChassisBMCs", len(errs)))
         if not errs:
-            print("  Nodes: PASS")
+            out.append("  ChassisBMCs: PASS")
         else:
-            print("  Nodes: FAIL")
+            numErrs += 1
+            out.append("  ChassisBMCs: FAIL")
             for emsg in errs:
-                print("    %s" % (emsg))
-
-        # Check NodeBMCs.  Missing == WARNING.  This is tricky, the SLS data
-        # doesn't have node BMCs, need to infer them from the nodes using the
-        # Parent field.  Check for presence in comps/RFEPs and mgmt ports,
-        # mismatches == WARNING.
-        # if so, report it as info.
-        errs = []
-        mappedComps = {}
-        for node in nodes:
-            node_xname = node['Xname']
-            if not node_xname.startswith(cab.xname):
+                out.append("    %s" % (emsg))
+
+    #
+    # Nodes
+    #
+
+    # Check Nodes.  Missing == WARNING.
+
+    # Iterate all nodes in SLS.  Check for not present in comps/rfeps,
+    # mgmt ports.  Any missing/mismatch is a FAIL.
+    errs = []
+    nodes = sls_index.getComponents(cab.xname, "Node")
+    for node in nodes:
+        node_xname = node.xname
+        if node_xname not in hsm_state_components:
+            # Check to see if the slot is populated
+            bmc_xname = xnames.parent(node_xname)
+            slot_xname = xnames.parent(bmc_xname)
+            if slot_xname is None:
+                errs.append("- %s - Not a valid node xname, can't find its BMC and slot." % node_xname)
                 continue
-            
-            # Determine xnames
-            bmc_xname = node['Parent']
-            slot_xname = get_component_parent(bmc_xname)
 
-            # Check to see if we have already processes this BMC before
-            if bmc_xname in mappedComps:
-                continue
-            mappedComps[bmc_xname] = True
-
-            # Check to see if this is ncn-m001's BMC. If so, then ignore it if its BMC is not connected to the HMN
-            if "ncn-m001" in node["ExtraProperties"]["Aliases"] and len(findNodeNics(bmc_xname, sls_hardware)) == 0:
-                continue
-
-            # Ignore empty slots. If a slot is empty then there is no blade present.
-            # print(f"Node BMC Slot: {slot_xname}")
-            if slot_xname in hsm_state_components and hsm_state_components[slot_xname]["State"] == "Empty":
+            # Ignore empty slots
+            if slot_xname in hsm_state_components and hsm_state_components[slot_xname].state == "Empty":
                 continue
 
             # Check to see if this node is expected to be present based on the node enclosure
-            expected_bmcs = getExpectedNodeBMCsForSlot(slot_xname, hsm_inventory_node_enclosures)
-            # print(f"Expected Node BMCs for {slot_xname}: {expected_bmcs}")
+            expected_bmcs = getExpectedNodesForSlot(slot_xname, hsm_inventory_node_enclosures)
             if expected_bmcs is not None:
                 if bmc_xname not in expected_bmcs:
-                    # print("Ignoring NodeBMC as it's not expected to be present")
                     continue
 
-            noc = doChecks(cab.xclass, node, bmc_xname, "NodeBMC", hsm_state_components, hsm_redfish_endpoints, sls_hardware)
+            # Not all nodes have NIDs, so check for that.
+            nidStr = "N/A"
+            if node.nid is not None:
+                nidStr = "%d" % (node.nid)
+            aliasString = "N/A"
+            if node.aliases:
+                aliasString = ", ".join(node.aliases)
+
+            errs.append("- %s (%s, NID %s, Alias %s) - Not found in HSM Components." %
+                (node_xname, node.role, nidStr, aliasString))
+
+    # Print out the node info.
+    checks.append(("Nodes", len(errs)))
+    if not errs:
+        out.append("  Nodes: PASS")
+    else:
+        out.append("  Nodes: FAIL")
+        for emsg in errs:
+            out.append("    %s" % (emsg))
+
+    # Check NodeBMCs.  Missing == WARNING.  This is tricky, the SLS data
+    # doesn't have node BMCs, need to infer them from the nodes using the
+    # Parent field.  Check for presence in comps/RFEPs and mgmt ports,
+    # mismatches == WARNING.
+    # if so, report it as info.
+    errs = []
+    mappedComps = {}
+    for node in nodes:
+        # Determine xnames
+        bmc_xname = node.parent
+        slot_xname = xnames.parent(bmc_xname)
+
+        # Check to see if we have already processes this BMC before
+        if bmc_xname in mappedComps:
+            continue
+        mappedComps[bmc_xname] = True
+
+        if slot_xname is None:
+            errs.append("- %s - Not a valid NodeBMC xname (parent of %s in SLS)." % (bmc_xname, node.xname))
+            continue
+
+        # Check to see if this is ncn-m001's BMC. If so, then ignore it if its BMC is not connected to the HMN
+        if "ncn-m001" in node.aliases and len(findNodeNics(bmc_xname, sls_index)) == 0:
+            continue
+
+        # Ignore empty slots. If a slot is empty then there is no blade present.
+        # print(f"Node BMC Slot: {slot_xname}")
+        if slot_xname in hsm_state_components and hsm_state_components[slot_xname].state == "Empty":
+            continue
+
+        # Check to see if this node is expected to be present based on the node enclosure
+        expected_bmcs = getExpectedNodeBMCsForSlot(slot_xname, hsm_inventory_node_enclosures)
+        # print(f"Expected Node BMCs for {slot_xname}: {expected_bmcs}")
+        if expected_bmcs is not None:
+            if bmc_xname not in expected_bmcs:
+                # print("Ignoring NodeBMC as it's not expected to be present")
+                continue
+
+        noc = doChecks(cab.xclass, node, bmc_xname, "NodeBMC", hsm_state_components, hsm_redfish_endpoints, sls_index)
+
+        if len(noc) > 0:
+            errs.append("- %s - %s." % (bmc_xname, noc))
+
+    # Print out the Node BMC info.
+    checks.append(("NodeBMCs", len(errs)))
+    if not errs:
+        out.append("  NodeBMCs: PASS")
+    else:
+        out.append("  NodeBMCs: FAIL")
+        for emsg in errs:
+            out.append("    %s" % (emsg))
+
+    # Check RouterBMCs.  Missing == WARNING.
+    errs = []
+    router_bmcs = sls_index.getComponents(cab.xname, "RouterBMC")
+    for router_bmc in router_bmcs:
+        bname = router_bmc.xname
+        noc = doChecks(cab.xclass, router_bmc, bname, "RouterBMC", hsm_state_components, hsm_redfish_endpoints, sls_index)
+        if len(noc) > 0:
+            errs.append("- %s - %s." % (bname, noc))
+
+    # Print out the Chassis BMC info.
+    checks.append(("RouterBMCs", len(errs)))
+    if not errs:
+        out.append("  RouterBMCs: PASS")
+    else:
+        numErrs += 1
+        out.append("  RouterBMCs: FAIL")
+        for emsg in errs:
+            out.append("    %s" % (emsg))
+
+    if check_river_specific_hardware:
+        # Check Gigabyte CMCs
+        errs = []
+        gigabyte_cmcs = sls_index.getCMCs(cab.xname)
+        for gigabyte_cmc in gigabyte_cmcs:
+            gigabyte_cmc_xname = gigabyte_cmc.xname
+            noc = doChecks(cab.xclass, gigabyte_cmc, gigabyte_cmc_xname, "ChassisBMC", hsm_state_components, hsm_redfish_endpoints, sls_index)
+
+            # Check to see if this is a "phantom Intel CMC", which shows up for intel compute nodes but is
+            # not a real device.
+            if len(findNodeNics(gigabyte_cmc_xname, sls_index)) == 0:
+                continue
 
             if len(noc) > 0:
-                errs.append("- %s - %s." % (bmc_xname, noc))
+                errs.append("- %s - %s." % (gigabyte_cmc_xname, noc))
 
-        # Print out the Node BMC info.
+        # Print out CMC info
+        checks.append(("CMCs", len(errs)))
         if not errs:
-            print("  NodeBMCs: PASS")
+            out.append("  CMCs: PASS")
         else:
-            print("  NodeBMCs: FAIL")
+            numErrs += 1
+            out.append("  CMCs: FAIL")
             for emsg in errs:
-                print("    %s" % (emsg))
+                out.append("    %s" % (emsg))
 
-        # Check RouterBMCs.  Missing == WARNING.
+        # Check CabPDUControllers in SLS.  Check comps/RFEP.  Mgmt port?
+        # Mismatches are FAIL.
         errs = []
-        router_bmcs = list(filter(lambda f: (f['TypeString'] == "RouterBMC"), sls_hardware))
-        for router_bmc in router_bmcs:
-            bname = router_bmc['Xname']
-            if not bname.startswith(cab.xname):
-                continue
-
-            noc = doChecks(cab.xclass, router_bmc, bname, "RouterBMC", hsm_state_components, hsm_redfish_endpoints, sls_hardware)
+        pdus = sls_index.getComponents(cab.xname, "CabinetPDUController")
+        for pdu in pdus:
+            bname = pdu.xname
+            noc = doChecks(cab.xclass, pdu, bname, "CabinetPDUController",  hsm_state_components, hsm_redfish_endpoints, sls_index)
             if len(noc) > 0:
                 errs.append("- %s - %s." % (bname, noc))
 
-        # Print out the Chassis BMC info.
+        # Print out the Cabinet PDU Controller info.
+        checks.append(("CabinetPDUControllers", len(errs)))
         if not errs:
-            print("  RouterBMCs: PASS")
+            out.append("  CabinetPDUControllers: PASS")
         else:
-            numErrs += 1
-            print("  RouterBMCs: FAIL")
+            out.append("  CabinetPDUControllers: FAIL")
             for emsg in errs:
-                print("    %s" % (emsg))
-
-        if check_river_specific_hardware:
-            # Check Gigabyte CMCs
-            errs = []
-            gigabyte_cmcs = list(filter(lambda f: (f['Xname'].endswith("b999")), sls_hardware))
-            for gigabyte_cmc in gigabyte_cmcs:
-                gigabyte_cmc_xname = gigabyte_cmc['Xname']
-                if not gigabyte_cmc_xname.startswith(cab.xname):
-                    continue
+                out.append("    %s" % (emsg))
+
+    return out, numErrs, checks
+
+# Worker side of the process pool used by genCabinetDetails.  The check data
+# is handed to the workers by forking after it's set, so it's shared
+# read-only rather than pickled for every cabinet.  Tasks are (cabinet,
+# profile index) tuples.
+
+worker_check_data = None
+
+def checkCabinetWorker(task):
+    cab, profile_index = task
+    profile = cabinet_check_profiles[profile_index]
+    return checkCabinet(worker_check_data, cab,
+        check_river_specific_hardware=profile["CheckRiverSpecificHardware"],
+        check_mountain_specific_hardware=profile["CheckMountainSpecificHardware"])
+
+# Generate the per-cabinet details for each check profile.  cabinets_by_profile
+# is a list of cabinets for each profile, see classifyCabinets().  With more
+# than one job the cabinets are checked across a process pool, the report is
+# still printed in cabinet order.  Returns the number of errors and a
+# (cabinet, checks) tuple for each cabinet, see checkCabinet().
+
+def genCabinetDetails(check_data, cabinets_by_profile, jobs=1):
+    global worker_check_data
+
+    tasks = []
+    for profile_index, cabinets in enumerate(cabinets_by_profile):
+        for cab in cabinets:
+            tasks.append((cab, profile_index))
+
+    worker_check_data = check_data
+    pool = None
+    if jobs > 1 and len(tasks) > 1:
+        # Imported here so runs without --jobs don't pay for it at startup
+        import multiprocessing
+        pool = multiprocessing.get_context("fork").Pool(min(jobs, len(tasks)))
+        results = pool.imap(checkCabinetWorker, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+    else:
+        results = map(checkCabinetWorker, tasks)
 
-                noc = doChecks(cab.xclass, gigabyte_cmc, bname, "ChassisBMC", hsm_state_components, hsm_redfish_endpoints, sls_hardware)
+    numErrs = 0
+    cabinet_checks = []
+    try:
+        for profile, cabinets in zip(cabinet_check_profiles, cabinets_by_profile):
+            print(profile["Title"])
+            print("============================")
+
+            for cab in cabinets:
+                out, errs, checks = next(results)
+                for line in out:
+                    print(line)
+                numErrs += errs
+                cabinet_checks.append((cab, checks))
+
+            if len(cabinets) == 0:
+                print("None Found.")
+
+            print("")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return numErrs, cabinet_checks
+
+# Metrics for the node-exporter textfile collector (--metrics-file).
+
+METRIC_PREFIX = "hms_discovery_verify_"
+
+def addSummaryMetrics(metrics, summaries):
+    for summary in summaries:
+        labels = {"cabinet": summary.cab.xname, "class": summary.cab.xclass}
+        for ctype, count in summary.components.items():
+            metrics.add(METRIC_PREFIX + "components", count, dict(labels, type=ctype),
+                help="Components of each type discovered in HSM, by cabinet.")
+        for role, count in summary.nodeRoles.items():
+            metrics.add(METRIC_PREFIX + "nodes", count, dict(labels, role=role),
+                help="Nodes discovered in HSM by role, by cabinet.")
+        for (mtype, state), count in summary.moduleSlots.items():
+            metrics.add(METRIC_PREFIX + "module_slots", count, dict(labels, type=mtype, state=state),
+                help="Compute and router module slots in HSM by state, by cabinet.")
+
+def addCheckMetrics(metrics, cabinet_checks):
+    for cab, checks in cabinet_checks:
+        labels = {"cabinet": cab.xname, "class": cab.xclass}
+        for check, problems in checks:
+            metrics.add(METRIC_PREFIX + "check_pass", problems == 0, dict(labels, check=check),
+                help="1 if the cabinet check passed, 0 if it failed.")
+            metrics.add(METRIC_PREFIX + "check_problems", problems, dict(labels, check=check),
+                help="Components the cabinet check reported.")
+
+def addRunMetrics(metrics, timer, numErrs):
+    metrics.add(METRIC_PREFIX + "success", numErrs is not None,
+        help="1 if the inventory was fetched and checked, 0 if it couldn't be.")
+    if numErrs is not None:
+        metrics.add(METRIC_PREFIX + "errors", numErrs,
+            help="Failed checks that fail the run.")
+    for phase, seconds in timer.phaseSeconds().items():
+        metrics.add(METRIC_PREFIX + "phase_duration_seconds", seconds, {"phase": phase},
+            help="Seconds spent in each phase of the run.")
+    metrics.add(METRIC_PREFIX + "last_run_timestamp_seconds", time.time(),
+        help="When the run finished, in seconds since the epoch.")
+
+# Fetch the inventory and run the checks, printing the report.  Results are
+# added to metrics if it isn't None.  Returns the number of errors, or None if
+# the inventory couldn't be fetched.
+
+def verifyDiscovery(hms, timer, cabinets=None, jobs=1, metrics=None):
+    # No auth is needed to replay a snapshot
+    if not hms.replay:
+        with timer.phase("auth"):
+            token = hms.authenticate()
+        if token == "":
+            print("ERROR: No/empty auth token, can't continue.")
+            return None
+
+    with timer.phase("fetch"):
+        ((hsm_state_components, hsm_state_components_stat),
+         (hsm_redfish_endpoints, hsm_redfish_endpoints_stat),
+         (hsm_inventory_node_enclosures, hsm_inventory_node_enclosures_stat),
+         (sls_index, sls_hardware_stat)) = getInventoryData(hms, cabinets)
+
+    if hsm_state_components_stat != 0:
+        print("HSM components returned non-zero.")
+        return None
 
-                # Check to see if this is a "phantom Intel CMC", which shows up for intel compute nodes but is
-                # not a real device.
-                if len(findNodeNics(gigabyte_cmc_xname, sls_hardware)) == 0:
-                    continue
+    # HSM Redfish information data
+    if hsm_redfish_endpoints_stat != 0:
+        print("HSM RFEPs returned non-zero.")
+        return None
 
-                if len(noc) > 0:
-                    errs.append("- %s - %s." % (bname, noc))
-
-            # Print out CMC info
-            if not errs:
-                print("  CMCs: PASS")
-            else:
-                numErrs += 1
-                print("  CMCs: FAIL")
-                for emsg in errs:
-                    print("    %s" % (emsg))
-
-            # Check CabPDUControllers in SLS.  Check comps/RFEP.  Mgmt port?
-            # Mismatches are FAIL.
-            pdus = list(filter(lambda f: (f['TypeString'] == "CabinetPDUController"), sls_hardware))
-            for pdu in pdus:
-                bname = pdu['Xname']
-                if not bname.startswith(cab.xname):
-                    continue
+    # HSM node enclosure inventory data
+    if hsm_inventory_node_enclosures_stat != 0:
+        print("HSM Inventory Hardware data for nodes returned non-zero.")
+        return None
 
-                noc = doChecks(cab.xclass, pdu, bname, "CabinetPDUController",  hsm_state_components, hsm_redfish_endpoints, sls_hardware)
-                if len(noc) > 0:
-                    errs.append("- %s - %s." % (bname, noc))
+    if sls_hardware_stat != 0:
+        print("SLS hardware data returned non-zero.")
+        return None
 
-            # Print out the Cabinet PDU Controller info.
-            if not errs:
-                print("  CabinetPDUControllers: PASS")
-            else:
-                print("  CabinetPDUControllers: FAIL")
-                for emsg in errs:
-                    print("    %s" % (emsg))
+    # Sort by cab num
+    clSorted = sls_index.getSortedCabinets()
 
-    if numCabs == 0:
-        print("None Found.")
+    if cabinets is not None:
+        for cab in sorted(cabinets - set(cab.xname for cab in clSorted)):
+            print("WARNING: Cabinet %s not found in SLS." % cab)
+
+    with timer.phase("summary"):
+        summaries = genSummary(clSorted, hsm_state_components)
+    if metrics is not None:
+        addSummaryMetrics(metrics, summaries)
+
+    with timer.phase("checks"):
+        check_data = CheckData(sls_index, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures)
+        numErrs, cabinet_checks = genCabinetDetails(check_data, classifyCabinets(clSorted), jobs)
+    if metrics is not None:
+        addCheckMetrics(metrics, cabinet_checks)
 
-    print("")
     return numErrs
 
+def usage():
+    print("Usage: %s [options]" % sys.argv[0])
+    print(" ")
+    print("   --cabinet=list        Comma-separated list of cabinets to verify, e.g.")
+    print("                         x1000,x3000.  Only their data is fetched from HSM.")
+    print("   --jobs=N              Check cabinets in parallel across N processes.")
+    print("   --metrics-file=file   Write the results and phase durations to file as")
+    print("                         Prometheus metrics, for the node-exporter textfile")
+    print("                         collector.  The file is replaced atomically.")
+    print(snapshot.USAGE)
+    print(timings.USAGE)
+    print(" ")
+
 # Entry point
 
 def main():
-    authToken = getAuthenticationToken()
-    if authToken == "":
-        print("ERROR: No/empty auth token, can't continue.")
-        return 1
-
-    hsm_state_components_raw, stat = getHSMComponents(authToken)
-    if stat != 0:
-        print("HSM components returned non-zero.")
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hj:", ["help", "cabinet=", "jobs=", "metrics-file="] + snapshot.LONG_OPTS + timings.LONG_OPTS)
+    except getopt.GetoptError:
+        usage()
         return 1
 
-    # Put HSM State components into a map
-    hsm_state_components = {}
-    for component in json.loads(hsm_state_components_raw)['Components']:
-        hsm_state_components[component["ID"]] = component
+    jobs = 1
+    cabinets = None
+    metrics_path = None
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            return 0
+        elif opt == "--cabinet":
+            cabinets = set(arg.split(","))
+            for cab in cabinets:
+                if xnames.cabinet(cab) != cab:
+                    print("ERROR: Invalid cabinet xname: '%s'" % cab)
+                    return 1
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                print("ERROR: Invalid --jobs: '%s'" % arg)
+                return 1
+        elif opt == "--metrics-file":
+            metrics_path = arg
 
-    # Retrieve HSM Redfish information data
-    hsm_redfish_endpoints_raw, stat = getHSMRFEP(authToken)
-    if stat != 0:
-        print("HSM RFEPs returned non-zero.")
+    try:
+        dataSnapshot = snapshot.fromOpts(opts)
+    except ValueError as err:
+        print("ERROR: %s" % err)
         return 1
-    
-    # Put HSM RedfishEndpoints into a map
-    hsm_redfish_endpoints = {}
-    for redfish_endpoint in json.loads(hsm_redfish_endpoints_raw)['RedfishEndpoints']:
-        hsm_redfish_endpoints[redfish_endpoint["ID"]] = redfish_endpoint
 
+    timer = timings.fromOpts(opts, record=metrics_path is not None)
+    hms = hmsclient.HMSClient(dataSnapshot, pool_size=FETCH_WORKERS, timings=timer)
 
-    # Retrieve HSM node enclosure inventory data
-    hsm_inventory_node_enclosures_raw, stat = getHSMInventoryHardwareForNodeEnclosures(authToken)
-    if stat != 0:
-        print("HSM Inventory Hardware data for nodes returned non-zero.")
-        return 1
+    metrics = None
+    if metrics_path is not None:
+        metrics = promMetrics.Metrics()
 
-    # Put HSM node enclosure inventory data into a map
-    hsm_inventory_node_enclosures = {}
-    for node_enclosure in json.loads(hsm_inventory_node_enclosures_raw):
-        hsm_inventory_node_enclosures[node_enclosure["ID"]] = node_enclosure
-    
+    numErrs = verifyDiscovery(hms, timer, cabinets, jobs, metrics)
 
-    sls_hardware_raw, stat = getSLSHWData(authToken)
-    if stat != 0:
-        print("SLS hardware data returned non-zero.")
+    if metrics is not None:
+        addRunMetrics(metrics, timer, numErrs)
+        try:
+            metrics.write(metrics_path)
+        except OSError as err:
+            print("ERROR: Can't write metrics to %s: %s" % (metrics_path, err))
+            return 1
+
+    if numErrs is None:
         return 1
-    sls_hardware = json.loads(sls_hardware_raw)
-
-    genSummary(sls_hardware, hsm_state_components)
-
-    print("River Cabinet Checks")
-    print("============================")
-    numErrs = genCabinetDetails(sls_hardware, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures,
-        lambda cab: cab.xclass == "River",
-        check_river_specific_hardware=True,
-        check_mountain_specific_hardware=False
-    )
-
-    print("Mountain/Hill Cabinet Checks")
-    print("============================")
-    numErrs += genCabinetDetails(sls_hardware, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures,
-        lambda cab: cab.xclass == "Mountain" or (cab.xclass == "Hill" and cab.model != "EX2500"),
-        check_river_specific_hardware=False,
-        check_mountain_specific_hardware=True
-    )
-
-    print("EX2500 Cabinet Checks")
-    print("============================")
-    numErrs += genCabinetDetails(sls_hardware, hsm_state_components, hsm_redfish_endpoints, hsm_inventory_node_enclosures,
-        lambda cab: cab.xclass == "Hill" and cab.model == "EX2500",
-        check_river_specific_hardware=True,
-        check_mountain_specific_hardware=True
-    )
 
     if numErrs > 0:
         print("\nFor interpreting and troubleshooting results, see https://github.com/Cray-HPE/docs-csm/blob/main/operations/validate_csm_health.md#221-interpreting-hsm-discovery-results\n")
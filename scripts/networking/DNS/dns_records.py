@@ -23,34 +23,22 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 #
 
-# Temporary workaround for invalid hostnames in ssl SAN fields that contain _'s
-# which are technically invalid for a hostname. Note only applies if someone has
-# updated the idna library on the system to a newer release than we have
-# shipped.
-#
-# Ref: https://github.com/kjd/idna/issues/50#issuecomment-449699205
-import idna
-
-idna.idnadata.codepoint_classes['PVALID'] = tuple(
-    sorted(list(idna.idnadata.codepoint_classes['PVALID']) + [0x5f0000005f])
-)
-
+import os
 import sys
 import getopt
 import json
-import base64
-import urllib3
-import requests
-# Note, version on v1.3 systems throws a warning in stderr
-from kubernetes import client, config
-from netaddr import IPNetwork, IPAddress
+import copy
+import time
+from bisect import bisect_right
+from operator import itemgetter
 
-# Get rid of cert warning messages
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from csm_common import timings
 
 
 #
-# Parse input args
+# Parse input args.  This is done before anything slow is imported so -h and
+# bad arguments return right away.
 #
 argv = sys.argv[1:]
 action = ''
@@ -60,12 +48,32 @@ filename = ''
 help_message = """Add or delete or print DNS records / IP Reservations from SLS.
 
 USAGE:  -i  - record in /etc/hosts format (see below)
+       [-b] - file of records in /etc/hosts format, one per line, or - for
+              stdin.  All records are applied before anything is written,
+              then each network that changed is written to SLS once.
        [-p] - pretty prints out existing reservations for viewing 
+       [--export=hosts|zone|json] - streams every reservation from SLS as
+              /etc/hosts lines, an RFC 1035 zone file fragment (A/AAAA and
+              CNAME records, names relative to the zone's origin) or JSON
+              Lines, starting before SLS has finished sending.
+       [--audit] - checks every reservation in every network for duplicate
+              IPs, names and aliases, names that are also aliases, and
+              addresses outside their subnet.  Each problem is printed as
+              a line of JSON; exits 1 if there are any.
+       [--allocate=network/subnet] [--count=N] [name ...]
+            - finds the next free addresses in a subnet.  Without names the
+              next N addresses are printed.  Each name, with any aliases in
+              the same argument, gets the next free address and all of them
+              are written to SLS in one update.  Reserved addresses, the
+              network, broadcast and gateway addresses and the DHCP range
+              aren't free.
        [-x] - deletes records in the csv file if they exist
        [-f] - force record replacement.  If a record currently exists
               in SLS it will be replaced with the file record. Default
               behavior is to leave the original record.
        [-v] - verbose debug
+       [--timings] - print where the run's time went to stderr at the end
+       [--profile=file] - write cProfile data for the run to file
 
 NOTE:  Record format - requires quotes:  "IPAddress Name/A Alias/CNAME[]"
        Example:        "10.92.100.71 api_gateway api-gw api_gw api-gw.local"
@@ -75,7 +83,7 @@ NOTE:  This program is idempotent - can safely try to add/del multiple times.
 """.format(sys.argv[0])
 
 try:
-    opts, args = getopt.getopt(argv, "i:hpxfv")
+    opts, args = getopt.getopt(argv, "i:b:hpxfv", ["audit", "allocate=", "count=", "export="] + timings.LONG_OPTS)
     if not opts:
         print(help_message)
         sys.exit(2)
@@ -84,7 +92,12 @@ except getopt.GetoptError:
     sys.exit(2)
 
 input_reservation = None
+batch_file = None
 prettyprint = False
+audit = False
+allocate = None
+count = None
+export_format = None
 debug = False
 force = False
 action = 'add'
@@ -94,14 +107,96 @@ for opt, arg in opts:
         sys.exit()
     elif opt in ("-i"):
         input_reservation = arg
+    elif opt in ("-b"):
+        batch_file = arg
     elif opt in ("-p"):
         prettyprint = True
+    elif opt == '--audit':
+        audit = True
+    elif opt == '--export':
+        export_format = arg
+    elif opt == '--allocate':
+        allocate = arg
+    elif opt == '--count':
+        try:
+            count = int(arg)
+        except ValueError:
+            count = 0
+        if count < 1:
+            print('Invalid --count: {}'.format(arg))
+            sys.exit(2)
     elif opt in ("-v"):
         debug = True
     elif opt in ("-f"):
         force = True
     elif opt in ("-x"):
         action = 'delete'
+if input_reservation and batch_file:
+    print('Use either -i or -b, not both.')
+    sys.exit(2)
+if export_format:
+    if export_format not in ('hosts', 'zone', 'json'):
+        print('Invalid --export format: {}'.format(export_format))
+        sys.exit(2)
+    if input_reservation or batch_file or allocate:
+        print('Use --export on its own, not with -i, -b or --allocate.')
+        sys.exit(2)
+if not allocate and (count is not None or args):
+    print('--count and names are only used with --allocate.')
+    sys.exit(2)
+if allocate:
+    if input_reservation or batch_file:
+        print('Use --allocate on its own, not with -i or -b.')
+        sys.exit(2)
+    if '/' not in allocate:
+        print('--allocate needs network/subnet, for example NMNLB/nmn_metallb_address_pool')
+        sys.exit(2)
+    if count is None:
+        count = len(args) or 1
+    elif args and count != len(args):
+        print('--count is {} but {} names were given.'.format(count, len(args)))
+        sys.exit(2)
+    # Each name and alias can only be given once, or two of the addresses
+    # would be reserved under the same name.
+    seen = set()
+    for names in args:
+        if not names.split():
+            print('Empty name given to --allocate.')
+            sys.exit(2)
+        for name in names.split():
+            if name in seen:
+                print('{} is given to --allocate more than once.'.format(name))
+                sys.exit(2)
+            seen.add(name)
+
+
+# Temporary workaround for invalid hostnames in ssl SAN fields that contain _'s
+# which are technically invalid for a hostname. Note only applies if someone has
+# updated the idna library on the system to a newer release than we have
+# shipped.
+#
+# Ref: https://github.com/kjd/idna/issues/50#issuecomment-449699205
+import idna
+
+idna.idnadata.codepoint_classes['PVALID'] = tuple(
+    sorted(list(idna.idnadata.codepoint_classes['PVALID']) + [0x5f0000005f])
+)
+
+import requests
+import urllib3
+from netaddr import IPNetwork, IPAddress, AddrFormatError
+
+from csm_common import hmsclient
+
+# Get rid of cert warning messages
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+#
+# A record that can't be applied
+#
+class ReservationError(Exception):
+    pass
 
 
 #
@@ -113,17 +208,25 @@ def on_debug(debug=False, message=None):
 
 
 #
-# Convenience wrapper around remote calls
+# Convenience wrapper around remote calls.  All calls share one HMS client
+# session, which adds the auth token.  The client verifies the gateway cert,
+# as the token request sending the admin client secret must; the SLS calls
+# pass verify=False themselves.
 #
+timer = timings.fromOpts(opts)
+hms = hmsclient.HMSClient(timings=timer)
+
 def remote_request(remote_type, remote_url, headers=None, data=None, verify=True, debug=False):
     remote_response = None
     while True:
         try:
-            response = requests.request(remote_type,
-                                        url=remote_url,
-                                        headers=headers,
-                                        data=data,
-                                        verify=verify)
+            start = time.perf_counter()
+            response = hms.request(remote_type,
+                                   remote_url,
+                                   headers=headers,
+                                   data=data,
+                                   verify=verify)
+            hms.recordResponse(remote_type, remote_url, response, start)
             on_debug(debug, 'Request response: {}'.format(response.text))
             response.raise_for_status()
             remote_response = json.dumps({})
@@ -137,56 +240,125 @@ def remote_request(remote_type, remote_url, headers=None, data=None, verify=True
 
 
 #
-# Get the admin client secret from Kubernetes
+# Get an auth token using the admin client secret from Kubernetes
 #
-secret = None
+token = None
 try:
-    config.load_kube_config()
-    v1 = client.CoreV1Api()
-    secret_obj = v1.list_namespaced_secret(
-        'default', field_selector='metadata.name=admin-client-auth')
-    secret_dict = secret_obj.to_dict()
-    secret_base64_str = secret_dict['items'][0]['data']['client-secret']
-    on_debug(debug, 'base64 secret from Kubernetes is {}'.format(secret_base64_str))
-    secret = base64.b64decode(secret_base64_str.encode('utf-8'))
-    on_debug(debug, 'secret from Kubernetes is {}'.format(secret))
+    with timer.phase('auth'):
+        token = hms.authenticate()
 except Exception as err:
     print('Error collecting secret from Kubernetes: {}'.format(err))
     sys.exit(1)
+if not token:
+    print('Error obtaining keycloak token')
+    sys.exit(1)
+on_debug(debug=debug, message='Auth Token from keycloak (first 50 char): {}'.format(
+    token[:50]))
 
 
-#
-# Get an auth token by using the secret
-#
-token = None
-try:
-    token_url = 'https://api-gw-service-nmn.local/keycloak/realms/shasta/protocol/openid-connect/token'
-    token_data = {'grant_type': 'client_credentials',
-                  'client_id': 'admin-client', 'client_secret': secret}
-    token_request = remote_request(
-        'POST', token_url, data=token_data, debug=debug)
-    token = token_request['access_token']
-    on_debug(debug=debug, message='Auth Token from keycloak (first 50 char): {}'.format(
-        token[:50]))
-except Exception as err:
-    print('Error obtaining keycloak token: {}'.format(err))
-    sys.exit(1)
+sls_url = 'https://api-gw-service-nmn.local/apis/sls/v1/networks'
+
+# Times a network is read and written back when someone else keeps changing it
+WRITE_ATTEMPTS = 3
 
 
 #
-# Get existing SLS data for comparison (used as a cache)
+# Index of the networks structure, built once so records are looked up
+# instead of searched for:
 #
-sls_cache = None
-sls_url = 'https://api-gw-service-nmn.local/apis/sls/v1/networks'
-auth_headers = {'Authorization': 'Bearer {}'.format(token)}
-try:
-    sls_cache = remote_request(
-        'GET', sls_url, headers=auth_headers, verify=False)
-    on_debug(debug=debug, message='SLS data has {} records'.format(len(sls_cache)))
-except Exception as err:
-    print('Error requesting EthernetInterfaces from SLS: {}'.format(err))
-    sys.exit(1)
-on_debug(debug=debug, message='SLS records {}'.format(sls_cache))
+# - every subnet by its address range, so the subnets containing an address
+#   are found with a binary search instead of building netaddr objects for
+#   every subnet on every lookup.  Ranges are kept as integer (first, last)
+#   addresses, sorted by first address, per IP version.
+# - every reservation in every network by IPAddress, Name and alias.  Each
+#   maps to the list of reservations using it, in networks structure order.
+#
+# Reservations added to or removed from the structure have to be added to or
+# removed from the index too, see update_network_reservation().
+#
+class NetworkIndex:
+    def __init__(self, cache):
+        self.ranges = {}
+        self.by_ip = {}
+        self.by_name = {}
+        self.by_alias = {}
+        # id(reservation) -> (order, network, subnet)
+        self.locations = {}
+        self.next_order = 0
+
+        rows_by_version = {}
+        order = 0
+        for network in cache:
+            if 'ExtraProperties' not in network or \
+               'Subnets' not in network['ExtraProperties'] or \
+               not network['ExtraProperties']['Subnets']:
+                   continue
+            for subnet in network['ExtraProperties']['Subnets']:
+                cidr = IPNetwork(subnet['CIDR'])
+                rows_by_version.setdefault(cidr.version, []).append(
+                    (cidr.first, cidr.last, order, network, subnet))
+                order += 1
+                for reservation in subnet.get('IPReservations') or []:
+                    self.add(network, subnet, reservation)
+
+        for version, rows in rows_by_version.items():
+            rows.sort(key=itemgetter(0, 2))
+            firsts = [row[0] for row in rows]
+            # Highest last address of the ranges up to each position, so a
+            # search can stop as soon as no earlier range can reach the address
+            # even when subnets overlap.
+            reach = []
+            highest = -1
+            for row in rows:
+                highest = max(highest, row[1])
+                reach.append(highest)
+            self.ranges[version] = (firsts, reach, rows)
+
+    # Return the (network, subnet) pairs whose CIDR contains ip, in the order
+    # they appear in the networks structure.
+    def find(self, ip):
+        address = IPAddress(ip)
+        if address.version not in self.ranges:
+            return []
+        value = int(address)
+        firsts, reach, rows = self.ranges[address.version]
+
+        found = []
+        i = bisect_right(firsts, value) - 1
+        while i >= 0 and reach[i] >= value:
+            if rows[i][1] >= value:
+                found.append(rows[i])
+            i -= 1
+        found.sort(key=itemgetter(2))
+        return [(row[3], row[4]) for row in found]
+
+    # Add a reservation that is in subnet of network.
+    def add(self, network, subnet, reservation):
+        self.locations[id(reservation)] = (self.next_order, network, subnet)
+        self.next_order += 1
+        self.by_ip.setdefault(reservation['IPAddress'], []).append(reservation)
+        self.by_name.setdefault(reservation['Name'], []).append(reservation)
+        for alias in reservation.get('Aliases') or []:
+            self.by_alias.setdefault(alias, []).append(reservation)
+
+    # Remove a reservation added with add().
+    def remove(self, reservation):
+        del self.locations[id(reservation)]
+        for table, keys in ((self.by_ip, [reservation['IPAddress']]),
+                            (self.by_name, [reservation['Name']]),
+                            (self.by_alias, reservation.get('Aliases') or [])):
+            for key in keys:
+                if key not in table:
+                    continue
+                remaining = [entry for entry in table[key] if entry is not reservation]
+                if remaining:
+                    table[key] = remaining
+                else:
+                    del table[key]
+
+    # Return the (network, subnet) a reservation is in.
+    def location(self, reservation):
+        return self.locations[id(reservation)][1:]
 
 
 #
@@ -204,11 +376,11 @@ def reservation_string(reservation):
 
 #
 # Given a reservation with or without aliases, this function finds _any_ match in the
-# existing /networks structure/cache for SLS.   This find may seem to find far too many
-# records, but the idea here is to report absolutely any existing matches and then let
-# the user decide to override on a case-by-case basis.  NOTE:  This simply finds records
-# that already exist and match, but if there are multiple it does NOT sort and find
-# priority.
+# existing /networks structure/cache for SLS, in any network.   This find may seem to
+# find far too many records, but the idea here is to report absolutely any existing
+# matches and then let the user decide to override on a case-by-case basis.  NOTE:  This
+# simply finds records that already exist and match, but if there are multiple it does
+# NOT sort and find priority.
 #
 # Record example:
 #     {'IPAddress': '10.92.100.72', 
@@ -217,52 +389,32 @@ def reservation_string(reservation):
 #                   'rsyslog_agg_service.local' ]
 #    }
 #
-def find_reservation(new_reservation, cache, debug=False):
-    matches = []
-    for network in cache:
-        if 'ExtraProperties' not in network or \
-           'Subnets' not in network['ExtraProperties'] or \
-           not network['ExtraProperties']['Subnets']:
-               continue
-        network_name = network['Name']
-        subnets = network['ExtraProperties']['Subnets']
-        for subnet in subnets:
-            subnet_name = subnet['Name']
-            subnet_cidr = subnet['CIDR']
-            if IPAddress(new_reservation['IPAddress']) not in IPNetwork(subnet_cidr):
-                continue
-            if 'IPReservations' not in subnet:
-                continue
-            on_debug(debug, 'Finding record: {} {} {}'.format(network_name, subnet_name, new_reservation))
-            reservations = subnet['IPReservations']
-            for reservation in reservations:
-                found = False
-                if new_reservation['IPAddress'] == reservation['IPAddress']:
-                    found = True
-                    on_debug(debug, '  Record match by IPAddress: {}'.format(reservation))
-                if new_reservation['Name'] == reservation['Name']:
-                    found = True
-                    on_debug(debug, '  Record match by Name: {}'.format(reservation))
-                if 'Aliases' in new_reservation and 'Aliases' in reservation:
-                    new_aliases = new_reservation['Aliases']
-                    aliases = reservation['Aliases']
-                    for alias in aliases:
-                        for new_alias in new_aliases:
-                            if new_alias == alias:
-                                found = True
-                                on_debug(debug, '  Record match by Alias: {}'.format(reservation))
-                    # It's possible that the proposed A record is already a CNAME/Alias elsewhere.
-                    if new_reservation['Name'] in aliases:
-                        found = True
-                        on_debug(debug, '  Record Name match in Alias: {}'.format(reservation))
-                if found:
-                    matches.append(reservation)
-    return matches
+def find_reservation(new_reservation, index, debug=False):
+    on_debug(debug, 'Finding record: {}'.format(new_reservation))
+    matches = {}
+
+    def match(reservations, how):
+        for reservation in reservations:
+            network, subnet = index.location(reservation)
+            on_debug(debug, '  Record match by {} in {} {}: {}'.format(
+                how, network['Name'], subnet['Name'], reservation))
+            matches[id(reservation)] = reservation
+
+    match(index.by_ip.get(new_reservation['IPAddress'], []), 'IPAddress')
+    match(index.by_name.get(new_reservation['Name'], []), 'Name')
+    for new_alias in new_reservation.get('Aliases') or []:
+        match(index.by_alias.get(new_alias, []), 'Alias')
+        # A proposed CNAME/Alias that is already an A record elsewhere.
+        match(index.by_name.get(new_alias, []), 'Alias in Name')
+    # It's possible that the proposed A record is already a CNAME/Alias elsewhere.
+    match(index.by_alias.get(new_reservation['Name'], []), 'Name in Alias')
+
+    return sorted(matches.values(), key=lambda reservation: index.locations[id(reservation)][0])
 
 
 
 #
-# Update and return the network structure from cache.
+# Update and return the network structure from the index.
 #
 # SLS requires that the entire network structure be modified (for just one reservation).
 #
@@ -270,44 +422,38 @@ def find_reservation(new_reservation, cache, debug=False):
 # Update:  MATCHES SOLELY BY IPAddress, NOT by Name or Aliases.  This is why the -f option exists.
 # Delete:  MATCHES SOLELY BY IPAddress, NOT by Name or Aliases.
 #
-def update_network_reservation(new_reservation, cache, delete=False, debug=False):
-    for network in cache:
-        if 'ExtraProperties' not in network or \
-           'Subnets' not in network['ExtraProperties'] or \
-           not network['ExtraProperties']['Subnets']:
-               continue
+def update_network_reservation(new_reservation, index, delete=False, debug=False):
+    for network, subnet in index.find(new_reservation['IPAddress']):
         network_name = network['Name']
-        subnets = network['ExtraProperties']['Subnets']
-        for subnet in subnets:
-            subnet_name = subnet['Name']
-            subnet_cidr = subnet['CIDR']
-            if IPAddress(new_reservation['IPAddress']) not in IPNetwork(subnet_cidr):
-                continue
-            if 'IPReservations' not in subnet:
-                # Stub out a new reservations structure
-                subnet['IPReservations'] = []
-            on_debug(debug, 'Finding record: {} {} {}'.format(network_name, subnet_name, new_reservation))
-            reservations = subnet['IPReservations']
-            found_idx = -1
-            for i, reservation in enumerate(reservations):
-                if new_reservation['IPAddress'] == reservation['IPAddress']:
-                    found_idx = i
-                    on_debug(debug, '  Record match by IPAddress: {}'.format(reservation))
-                    break
-            if found_idx >= 0:
-                if not delete:
-                    reservations[i] = new_reservation
-                    on_debug(debug, '  Updated record in structure.')
-                    return network
-                else:
-                    reservations.pop(i)
-                    on_debug(debug, '  Deleted record in structure.')
-                    return network
+        subnet_name = subnet['Name']
+        if 'IPReservations' not in subnet:
+            # Stub out a new reservations structure
+            subnet['IPReservations'] = []
+        on_debug(debug, 'Finding record: {} {} {}'.format(network_name, subnet_name, new_reservation))
+        reservations = subnet['IPReservations']
+        found_idx = -1
+        for existing in index.by_ip.get(new_reservation['IPAddress'], []):
+            if index.location(existing)[1] is subnet:
+                found_idx = next(i for i, reservation in enumerate(reservations) if reservation is existing)
+                on_debug(debug, '  Record match by IPAddress: {}'.format(existing))
+                break
+        if found_idx >= 0:
+            index.remove(reservations[found_idx])
+            if not delete:
+                reservations[found_idx] = new_reservation
+                index.add(network, subnet, new_reservation)
+                on_debug(debug, '  Updated record in structure.')
+                return network
             else:
-                if not delete:
-                    reservations.append(new_reservation)
-                    on_debug(debug, '  Added record in structure.')
-                    return network
+                reservations.pop(found_idx)
+                on_debug(debug, '  Deleted record in structure.')
+                return network
+        else:
+            if not delete:
+                reservations.append(new_reservation)
+                index.add(network, subnet, new_reservation)
+                on_debug(debug, '  Added record in structure.')
+                return network
     # TODO: better
     return {}
 
@@ -317,7 +463,7 @@ def update_network_reservation(new_reservation, cache, delete=False, debug=False
 # Print out all reservations per network and per subnet.
 #
 def pretty_print_reservations(cache):
-    for network in sls_cache:
+    for network in cache:
         if 'ExtraProperties' not in network or \
            'Subnets' not in network['ExtraProperties'] or \
            not network['ExtraProperties']['Subnets']:
@@ -344,31 +490,201 @@ def pretty_print_reservations(cache):
 
 
 #
-# Pretty Print existing SLS Reservations
+# Export pipeline.  Each stage is a generator, so every network is formatted
+# and written as soon as it has been read from SLS and dropped afterwards:
 #
-if prettyprint:
-    pretty_print_reservations(sls_cache)
-    sys.exit()
+#   stream_networks() -> iter_reservations() -> hosts/zone/json_lines()
+#
+# Stream the networks from SLS one at a time, without reading the whole
+# response first.  A failed request raises a RequestException and a response
+# that isn't a list of networks a ValueError.
+#
+def stream_networks(debug=False):
+    start = time.perf_counter()
+    with hms.request('GET', sls_url, stream=True, verify=False) as response:
+        if response.status_code >= 300:
+            hms.recordResponse('GET', sls_url, response, start)
+            raise requests.exceptions.HTTPError('{} {} for url: {}'.format(
+                response.status_code, response.reason, sls_url), response=response)
+        chunks = timings.ReadCounter(response.iter_content(chunk_size=hmsclient.STREAM_CHUNK_SIZE))
+        for network in hmsclient.iterJSONArray(chunks):
+            on_debug(debug, 'Streamed network {}'.format(network.get('Name')))
+            yield network
+    hms.recordStream(sls_url, response.status_code, start, response.elapsed.total_seconds(), chunks)
 
 
+#
+# Yield (network, subnet, reservation) for every reservation in networks.
+#
+def iter_reservations(networks):
+    for network in networks:
+        for subnet in network.get('ExtraProperties', {}).get('Subnets') or []:
+            for reservation in subnet.get('IPReservations') or []:
+                yield network, subnet, reservation
+
 
 #
-# Update the existing reservations:  add/modify/del
+# Format reservations as /etc/hosts lines, with a comment before each subnet.
 #
-if input_reservation:
-    print('New record: {}'.format(input_reservation))
+def hosts_lines(reservations):
+    current = None
+    for network, subnet, reservation in reservations:
+        if current is not subnet:
+            current = subnet
+            yield '# {} {} {}'.format(network['Name'], subnet['Name'], subnet.get('CIDR', ''))
+        yield reservation_string(reservation)
+
+
+#
+# Format reservations as RFC 1035 resource records:  an A (or AAAA) record
+# for each Name and a CNAME to it for each alias.
+#
+def zone_lines(reservations):
+    current = None
+    for network, subnet, reservation in reservations:
+        if current is not subnet:
+            current = subnet
+            yield '; {} {} {}'.format(network['Name'], subnet['Name'], subnet.get('CIDR', ''))
+        rtype = 'AAAA' if ':' in reservation['IPAddress'] else 'A'
+        yield '{}\tIN\t{}\t{}'.format(reservation['Name'], rtype, reservation['IPAddress'])
+        for alias in reservation.get('Aliases') or []:
+            yield '{}\tIN\tCNAME\t{}'.format(alias, reservation['Name'])
+
+
+#
+# Format reservations as JSON Lines, one object per reservation.
+#
+def json_lines(reservations):
+    for network, subnet, reservation in reservations:
+        yield json.dumps({'Network': network['Name'], 'Subnet': subnet['Name'],
+                          'IPAddress': reservation['IPAddress'], 'Name': reservation['Name'],
+                          'Aliases': reservation.get('Aliases') or []})
+
+
+export_formats = {'hosts': hosts_lines, 'zone': zone_lines, 'json': json_lines}
+
+
+#
+# Check every reservation in every network in one pass, yielding a dict for
+# each problem found:
+#
+#   invalid_cidr     a subnet CIDR that doesn't parse
+#   invalid_ip       a reservation IPAddress that doesn't parse
+#   outside_subnet   a reservation whose IPAddress isn't in its subnet's CIDR
+#   duplicate_ip     an IPAddress reserved more than once
+#   duplicate_name   a Name reserved more than once
+#   duplicate_alias  an alias used by more than one reservation
+#   name_is_alias    a Name (A record) that is also an alias (CNAME) of
+#                    another reservation
+#
+# Each problem has the check, the value concerned and the reservations
+# involved, with the network and subnet each is in.  Problems with a single
+# reservation are yielded as they're found, the rest after the pass.
+#
+def audit_reservations(cache):
+    by_ip = {}
+    by_name = {}
+    by_alias = {}
 
-    # Decompose input into a JSON record
-    val = input_reservation.split()
+    def location(network, subnet, reservation):
+        return {'Network': network.get('Name'), 'Subnet': subnet.get('Name'), 'CIDR': subnet.get('CIDR'),
+                'IPAddress': reservation.get('IPAddress'), 'Name': reservation.get('Name')}
+
+    for network in cache:
+        if 'ExtraProperties' not in network or \
+           'Subnets' not in network['ExtraProperties'] or \
+           not network['ExtraProperties']['Subnets']:
+               continue
+        for subnet in network['ExtraProperties']['Subnets']:
+            try:
+                cidr = IPNetwork(subnet['CIDR'])
+            except (KeyError, AddrFormatError, ValueError, TypeError):
+                cidr = None
+                yield {'check': 'invalid_cidr', 'value': subnet.get('CIDR'),
+                       'network': network.get('Name'), 'subnet': subnet.get('Name')}
+
+            for reservation in subnet.get('IPReservations') or []:
+                here = location(network, subnet, reservation)
+                ip = reservation.get('IPAddress')
+                try:
+                    address = IPAddress(ip)
+                except (AddrFormatError, ValueError, TypeError):
+                    yield {'check': 'invalid_ip', 'value': ip, 'reservations': [here]}
+                    address = None
+                if address is not None and cidr is not None and \
+                   (address.version != cidr.version or not cidr.first <= int(address) <= cidr.last):
+                    yield {'check': 'outside_subnet', 'value': ip, 'reservations': [here]}
+
+                by_ip.setdefault(ip, []).append(here)
+                by_name.setdefault(reservation.get('Name'), []).append((here, reservation))
+                for alias in set(reservation.get('Aliases') or []):
+                    by_alias.setdefault(alias, []).append((here, reservation))
+
+    for ip, found in by_ip.items():
+        if len(found) > 1:
+            yield {'check': 'duplicate_ip', 'value': ip, 'reservations': found}
+    for name, found in by_name.items():
+        if len(found) > 1:
+            yield {'check': 'duplicate_name', 'value': name, 'reservations': [here for here, _ in found]}
+    for alias, found in by_alias.items():
+        if len(found) > 1:
+            yield {'check': 'duplicate_alias', 'value': alias, 'reservations': [here for here, _ in found]}
+    for name, found in by_name.items():
+        named = set(id(reservation) for _, reservation in found)
+        aliased = [here for here, reservation in by_alias.get(name, []) if id(reservation) not in named]
+        if aliased:
+            yield {'check': 'name_is_alias', 'value': name,
+                   'reservations': [here for here, _ in found] + aliased}
+
+
+#
+# Decompose a record in /etc/hosts format into a JSON record
+#
+def parse_reservation(line):
+    val = line.split()
+    if len(val) < 2:
+        raise ReservationError('Record needs at least an IPAddress and a Name: {}'.format(line.strip()))
     record = {}
     record['IPAddress'] = val.pop(0)
     record['Name'] = val.pop(0)
     if val:
         record['Aliases'] = val
-    updated_network = {}
+    try:
+        IPAddress(record['IPAddress'])
+    except AddrFormatError:
+        raise ReservationError('Invalid IPAddress: {}'.format(record['IPAddress']))
+    return record
+
 
-    # Find matching existing records
-    matches = find_reservation(record, sls_cache, debug)
+#
+# Read records in /etc/hosts format from a file, or stdin for '-'.  Blank
+# lines and comments are skipped.  Returns (line number, record) pairs.
+#
+def read_reservations(filename):
+    records = []
+    f = sys.stdin if filename == '-' else open(filename)
+    try:
+        for lineno, line in enumerate(f, 1):
+            line = line.split('#', 1)[0]
+            if not line.strip():
+                continue
+            records.append((lineno, parse_reservation(line)))
+    except ReservationError as err:
+        raise ReservationError('{} line {}: {}'.format(filename, lineno, err))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return records
+
+
+#
+# Apply one reservation to the network structures in index:  add/modify/del.
+# Existing matches are only replaced or deleted with -f.  Returns the changed
+# network and a description of the change, or (None, None) if the record was
+# left alone.  Raises ReservationError if it can't be applied.
+#
+def apply_reservation(record, index, action, force, debug=False):
+    matches = find_reservation(record, index, debug)
 
     if matches:
         print('Existing record match.')
@@ -377,39 +693,377 @@ if input_reservation:
             print('  New     : {}'.format(reservation_string(record)))
             if not force:
                 print('Cowardly refusing to update without -f')
-            else:
-                if action == 'delete':
-                    updated_network = update_network_reservation(record, sls_cache, delete=True, debug=debug)
-                    print('Deleted reservation record in network structure (-x -f): {}'.format(updated_network['Name']))
-                    add_record = remote_request('PUT',
-                                                sls_url+'/{}'.format(updated_network['Name']),
-                                                headers=auth_headers,
-                                                data=json.dumps(updated_network),
-                                                verify=False,
-                                                debug=debug)
-                    print('Deleted existing reservation record in SLS')
-                else:
-                    updated_network = update_network_reservation(record, sls_cache, debug=debug)
-                    print('Updated reservation record in network structure (-f): {}'.format(updated_network['Name']))
-                    add_record = remote_request('PUT',
-                                                sls_url+'/{}'.format(updated_network['Name']),
-                                                headers=auth_headers,
-                                                data=json.dumps(updated_network),
-                                                verify=False,
-                                                debug=debug)
-                    print('Replaced existing reservation record in SLS')
-    else:
-        print('No existing record match.')
-        updated_network = update_network_reservation(record, sls_cache, debug=debug)
+        if not force:
+            return None, None
+
+        if action == 'delete':
+            updated_network = update_network_reservation(record, index, delete=True, debug=debug)
+            if not updated_network:
+                raise ReservationError('No reservation with IPAddress {} to delete.'.format(record['IPAddress']))
+            print('Deleted reservation record in network structure (-x -f): {}'.format(updated_network['Name']))
+            return updated_network, 'Deleted existing reservation record'
+
+        updated_network = update_network_reservation(record, index, debug=debug)
         if not updated_network:
-            print('Error: Network or Subnet not found to add reservation.  Use -p to check available data')
-            sys.exit(1)
-        else:
-             # NOTE:  If no new record, even a -x puts you here...
-            add_record = remote_request('PUT',
-                                        sls_url+'/{}'.format(updated_network['Name']),
-                                        headers=auth_headers,
-                                        data=json.dumps(updated_network),
-                                        verify=False,
-                                        debug=debug)
-            print('Created new reservation record in SLS')
+            raise ReservationError('Network or Subnet not found for {}.'.format(record['IPAddress']))
+        print('Updated reservation record in network structure (-f): {}'.format(updated_network['Name']))
+        return updated_network, 'Replaced existing reservation record'
+
+    print('No existing record match.')
+    if action == 'delete':
+        print('Nothing to delete.')
+        return None, None
+    updated_network = update_network_reservation(record, index, debug=debug)
+    if not updated_network:
+        raise ReservationError('Network or Subnet not found to add reservation.  Use -p to check available data')
+    return updated_network, 'Created new reservation record'
+
+
+#
+# Write a network structure back to SLS.
+#
+def put_network(network, debug=False):
+    return remote_request('PUT',
+                          sls_url+'/{}'.format(network['Name']),
+                          data=json.dumps(network),
+                          verify=False,
+                          debug=debug)
+
+
+#
+# Get every network from SLS.
+#
+def get_networks(debug=False):
+    networks = None
+    try:
+        networks = remote_request(
+            'GET', sls_url, verify=False)
+        on_debug(debug=debug, message='SLS data has {} records'.format(len(networks)))
+    except Exception as err:
+        print('Error requesting EthernetInterfaces from SLS: {}'.format(err))
+        sys.exit(1)
+    on_debug(debug=debug, message='SLS records {}'.format(networks))
+    return networks
+
+
+#
+# Networks changed in memory and waiting to be written back to SLS.  A copy of
+# each network is kept as it was read, along with the records applied to it,
+# so that if someone else changed the network in SLS in the meantime the
+# records are applied again to their version instead of overwriting it.
+#
+class PendingChanges:
+    def __init__(self):
+        self.originals = {}
+        self.networks = {}
+        self.records = {}
+
+    # Call before applying record to the networks in index.
+    def before(self, record, index):
+        for network, _ in index.find(record['IPAddress']):
+            if network['Name'] not in self.originals:
+                self.originals[network['Name']] = copy.deepcopy(network)
+
+    # Call when applying record changed network.
+    def changed(self, network, record, delete):
+        self.networks[network['Name']] = network
+        self.records.setdefault(network['Name'], []).append((record, delete))
+
+
+#
+# Write a changed network back to SLS.  With recheck the network is read again
+# first, and if it's no longer the version the changes were made to, the
+# changes are applied again to the current version, or with reapply False,
+# given up on.  SLS has no conditional PUT, so this narrows the window for
+# overwriting someone else's change to the time between that read and the PUT.
+# Without recheck the network is written as it is, for changes made straight
+# after SLS was read where the extra read would only add to the transfer.
+#
+def write_network(name, changes, debug=False, reapply=True, recheck=True):
+    original = changes.originals[name]
+    network = changes.networks[name]
+    if not recheck:
+        put_network(network, debug=debug)
+        return
+
+    for attempt in range(WRITE_ATTEMPTS):
+        current = remote_request('GET', sls_url+'/{}'.format(name), verify=False, debug=debug)
+        if current == original:
+            put_network(network, debug=debug)
+            return
+
+        if not reapply:
+            raise ReservationError('Network {} was changed in SLS since it was read, run again.'.format(name))
+        records = changes.records[name]
+        print('Network {} was changed in SLS since it was read, applying {} record(s) to the current version.'.format(
+            name, len(records)))
+        original = copy.deepcopy(current)
+        index = NetworkIndex([current])
+        for record, delete in records:
+            if not update_network_reservation(record, index, delete=delete, debug=debug) and not delete:
+                raise ReservationError('Subnet for {} is no longer in network {}.'.format(
+                    reservation_string(record), name))
+        network = current
+
+    raise ReservationError('Network {} kept changing in SLS, gave up after {} attempts.'.format(
+        name, WRITE_ATTEMPTS))
+
+
+#
+# Occupancy bitmap of a range of addresses, one bit per address, so even a
+# large subnet costs a byte per eight addresses and no per-address objects.
+# Addresses are integers.
+#
+class AddressBitmap:
+    def __init__(self, first, size):
+        self.first = first
+        self.size = size
+        self.bits = bytearray((size + 7) // 8)
+
+    # Mark the addresses from first to last used.  Any outside the bitmap are
+    # ignored.
+    def mark(self, first, last=None):
+        if last is None:
+            last = first
+        lo = max(first - self.first, 0)
+        hi = min(last - self.first, self.size - 1)
+        while lo <= hi and lo % 8:
+            self.bits[lo >> 3] |= 1 << (lo & 7)
+            lo += 1
+        while lo <= hi and (hi + 1) % 8:
+            self.bits[hi >> 3] |= 1 << (hi & 7)
+            hi -= 1
+        if lo <= hi:
+            self.bits[lo >> 3:(hi >> 3) + 1] = b'\xff' * ((hi - lo + 1) >> 3)
+
+    # Return up to count unused addresses, lowest first.
+    def free(self, count):
+        found = []
+        for byte_index, byte in enumerate(self.bits):
+            if byte == 0xff:
+                continue
+            for bit in range(8):
+                offset = (byte_index << 3) + bit
+                if offset >= self.size or len(found) == count:
+                    return found
+                if not byte & (1 << bit):
+                    found.append(self.first + offset)
+        return found
+
+
+#
+# Return the first count free addresses in subnet, lowest first, as strings.
+# An address isn't free if it's reserved in any network, is the subnet's
+# network, broadcast or gateway address, or is in its DHCP range.  Only the
+# start of the subnet that has to hold count free addresses past all of those
+# is put in the bitmap, which keeps it small for a /16 or an IPv6 subnet.
+# Raises ReservationError if the subnet's CIDR or DHCP range can't be parsed.
+#
+def free_addresses(subnet, index, count):
+    try:
+        cidr = IPNetwork(subnet['CIDR'])
+    except (KeyError, AddrFormatError, ValueError, TypeError):
+        raise ReservationError('Invalid CIDR in subnet {}: {}'.format(subnet.get('Name'), subnet.get('CIDR')))
+    first, last = cidr.first, cidr.last
+    if cidr.version == 4 and cidr.prefixlen < 31:
+        first += 1
+        last -= 1
+
+    used = []
+    for ip in list(index.by_ip) + [subnet.get('Gateway')]:
+        try:
+            address = IPAddress(ip)
+        except (AddrFormatError, ValueError, TypeError):
+            continue
+        if address.version == cidr.version and first <= int(address) <= last:
+            used.append(int(address))
+    dhcp = None
+    if subnet.get('DHCPStart') and subnet.get('DHCPEnd'):
+        try:
+            dhcp = (int(IPAddress(subnet['DHCPStart'])), int(IPAddress(subnet['DHCPEnd'])))
+        except (AddrFormatError, ValueError, TypeError):
+            raise ReservationError('Invalid DHCP range in subnet {}: {} - {}'.format(
+                subnet.get('Name'), subnet['DHCPStart'], subnet['DHCPEnd']))
+
+    size = len(used) + count
+    if dhcp:
+        size += max(min(dhcp[1], last) - max(dhcp[0], first) + 1, 0)
+    bitmap = AddressBitmap(first, min(size, last - first + 1))
+    for value in used:
+        bitmap.mark(value)
+    if dhcp:
+        bitmap.mark(*dhcp)
+    return [str(IPAddress(value, cidr.version)) for value in bitmap.free(count)]
+
+
+#
+# Export every reservation.  This streams from SLS itself rather than reading
+# the whole networks structure below.
+#
+if export_format:
+    try:
+        with timer.phase('export'):
+            for line in export_formats[export_format](iter_reservations(stream_networks(debug))):
+                print(line)
+    except (ValueError, requests.exceptions.RequestException) as err:
+        print('Error reading networks from SLS: {}'.format(err), file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        # The reader (head, grep -m, ...) has all it wants
+        sys.stderr.close()
+    sys.exit()
+
+
+#
+# Get existing SLS data for comparison (used as a cache).  Every network is
+# read, even for a single record, since its Name and aliases have to be checked
+# against the records in all of them.  -b and --allocate read each network
+# again before writing it back, since a batch's records are read after this
+# and someone else may have taken the addresses allocated, see write_network().
+#
+record = None
+if input_reservation and not prettyprint and not audit:
+    print('New record: {}'.format(input_reservation))
+    try:
+        record = parse_reservation(input_reservation)
+    except ReservationError as err:
+        print('Error: {}'.format(err))
+        sys.exit(1)
+with timer.phase('fetch'):
+    sls_cache = get_networks(debug)
+
+
+#
+# Pretty Print existing SLS Reservations
+#
+if prettyprint:
+    pretty_print_reservations(sls_cache)
+    sys.exit()
+
+
+#
+# Audit every reservation
+#
+if audit:
+    problems = 0
+    for problem in audit_reservations(sls_cache):
+        print(json.dumps(problem))
+        problems += 1
+    print('Audited {} networks, {} problems found'.format(len(sls_cache), problems), file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+
+sls_index = NetworkIndex(sls_cache)
+changes = PendingChanges()
+
+
+#
+# Update a single reservation:  add/modify/del
+#
+if input_reservation:
+    try:
+        changes.before(record, sls_index)
+        updated_network, change = apply_reservation(record, sls_index, action, force, debug)
+        if updated_network:
+            changes.changed(updated_network, record, action == 'delete')
+            # Written straight after the read, so there's nothing to recheck
+            with timer.phase('update'):
+                write_network(updated_network['Name'], changes, debug, recheck=False)
+            print('{} in SLS'.format(change))
+    except ReservationError as err:
+        print('Error: {}'.format(err))
+        sys.exit(1)
+
+
+#
+# Apply a file of reservations in memory, then write each network that changed
+# back to SLS once, however many of its records changed.
+#
+if batch_file:
+    try:
+        records = read_reservations(batch_file)
+    except (OSError, ReservationError) as err:
+        print('Error: {}'.format(err))
+        sys.exit(1)
+
+    errors = 0
+    for lineno, record in records:
+        print('New record (line {}): {}'.format(lineno, reservation_string(record)))
+        try:
+            changes.before(record, sls_index)
+            updated_network, change = apply_reservation(record, sls_index, action, force, debug)
+        except ReservationError as err:
+            print('Error: {}'.format(err))
+            errors += 1
+            continue
+        if updated_network:
+            changes.changed(updated_network, record, action == 'delete')
+
+    updated = 0
+    with timer.phase('update'):
+        for name in changes.networks:
+            try:
+                write_network(name, changes, debug)
+            except ReservationError as err:
+                print('Error: {}'.format(err))
+                errors += 1
+                continue
+            updated += 1
+            print('Updated network {} in SLS'.format(name))
+
+    print('{} records, {} networks updated, {} errors'.format(len(records), updated, errors))
+    if errors:
+        sys.exit(1)
+
+
+#
+# Find the next free addresses in a subnet and print them, or reserve them for
+# the names given, writing the network back to SLS once.
+#
+if allocate:
+    network_name, subnet_name = allocate.split('/', 1)
+    network = next((network for network in sls_cache if network['Name'] == network_name), None)
+    subnets = network.get('ExtraProperties', {}).get('Subnets') or [] if network else []
+    subnet = next((subnet for subnet in subnets if subnet['Name'] == subnet_name), None)
+    if subnet is None:
+        print('Error: Network or Subnet not found: {}.  Use -p to check available data'.format(allocate))
+        sys.exit(1)
+
+    try:
+        addresses = free_addresses(subnet, sls_index, count)
+    except ReservationError as err:
+        print('Error: {}'.format(err))
+        sys.exit(1)
+    if len(addresses) < count:
+        print('Error: Only {} free addresses in {}, {} needed.'.format(len(addresses), allocate, count))
+        sys.exit(1)
+    if not args:
+        for address in addresses:
+            print(address)
+        sys.exit()
+
+    records = [parse_reservation('{} {}'.format(address, names)) for address, names in zip(addresses, args)]
+    errors = 0
+    for record in records:
+        for match in find_reservation(record, sls_index, debug):
+            print('Error: {} is already reserved: {}'.format(record['Name'], reservation_string(match)))
+            errors += 1
+    if errors:
+        print('Nothing reserved.')
+        sys.exit(1)
+
+    for record in records:
+        changes.before(record, sls_index)
+        subnet.setdefault('IPReservations', []).append(record)
+        sls_index.add(network, subnet, record)
+        changes.changed(network, record, False)
+        print(reservation_string(record))
+
+    try:
+        with timer.phase('update'):
+            write_network(network_name, changes, debug, reapply=False)
+    except ReservationError as err:
+        print('Error: {}'.format(err))
+        sys.exit(1)
+    print('Reserved {} addresses in {} in SLS'.format(len(addresses), allocate))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2026 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+# Tests for dns_records.py.  The script is run against a fake SLS served on
+# localhost, with requests to the API gateway redirected to it and the
+# Kubernetes secret lookup stubbed out, so nothing outside this process is
+# touched.  Run with:
+#
+#   python3 -m unittest test_dns_records.py
+
+import contextlib
+import copy
+import io
+import json
+import os
+import runpy
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_dir, "..", ".."))
+from csm_common import hmsclient
+
+import requests
+
+API_GATEWAY = "https://api-gw-service-nmn.local"
+SLS_NETWORKS = "/apis/sls/v1/networks"
+
+NETWORKS = [
+    {"Name": "HMN", "ExtraProperties": {"Subnets": [
+        {"Name": "network_hardware", "CIDR": "10.254.0.0/17", "IPReservations": [
+            {"IPAddress": "10.254.0.50", "Name": "foo", "Aliases": ["foo.local"]},
+        ]},
+    ]}},
+    {"Name": "NMN", "ExtraProperties": {"Subnets": [
+        {"Name": "bootstrap_dhcp", "CIDR": "10.252.0.0/17", "IPReservations": [
+            {"IPAddress": "10.252.1.10", "Name": "ncn-w001"},
+        ]},
+    ]}},
+]
+
+class FakeSLS(BaseHTTPRequestHandler):
+    """SLS networks API over the networks in self.server.networks."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        networks = self.server.networks
+        path = self.path.split("?")[0]
+        self.server.gets.append(path)
+        if self.server.error:
+            self.reply(self.server.error, {"detail": "error"})
+            return
+        if path == SLS_NETWORKS:
+            self.reply(200, networks)
+            return
+        name = path.rsplit("/", 1)[1]
+        found = [network for network in networks if network["Name"] == name]
+        if found:
+            self.reply(200, found[0])
+        else:
+            self.reply(404, {"detail": "not found"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.reply(200, {"access_token": "token", "expires_in": 300})
+
+    def do_PUT(self):
+        network = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.puts.append(network["Name"])
+        self.server.networks = [network if old["Name"] == network["Name"] else old
+                                for old in self.server.networks]
+        self.reply(200, network)
+
+class DNSRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSLS)
+        self.server.networks = copy.deepcopy(NETWORKS)
+        self.server.error = None
+        self.server.gets = []
+        self.server.puts = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def run_script(self, *args):
+        """Run dns_records.py with args, returning its exit status and output (stdout and stderr)."""
+        base = "http://127.0.0.1:%d" % self.server.server_address[1]
+        request = requests.Session.request
+
+        def redirect(session, method, url, *rest, **kwargs):
+            return request(session, method, url.replace(API_GATEWAY, base), *rest, **kwargs)
+
+        out = io.StringIO()
+        status = 0
+        with mock.patch.object(requests.Session, "request", redirect), \
+             mock.patch.object(hmsclient, "getClientSecret", lambda: "secret"), \
+             mock.patch.dict(os.environ, {"HMS_TOKEN_CACHE": ""}), \
+             mock.patch.object(sys, "argv", ["dns_records.py"] + list(args)), \
+             contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            try:
+                runpy.run_path(os.path.join(script_dir, "dns_records.py"), run_name="__main__")
+            except SystemExit as err:
+                status = err.code or 0
+        return status, out.getvalue()
+
+    def reservations(self, network_name):
+        network = [network for network in self.server.networks if network["Name"] == network_name][0]
+        return network["ExtraProperties"]["Subnets"][0]["IPReservations"]
+
+    def test_name_in_another_network_conflicts(self):
+        # foo is reserved in HMN, the new address is in NMN
+        status, out = self.run_script("-i", "10.252.1.50 foo")
+        self.assertIn("Existing record match.", out)
+        self.assertIn("Existing: 10.254.0.50 foo foo.local", out)
+        self.assertIn("Cowardly refusing to update without -f", out)
+        self.assertEqual(self.server.puts, [])
+        self.assertEqual([res["Name"] for res in self.reservations("NMN")], ["ncn-w001"])
+
+    def test_alias_in_another_network_conflicts(self):
+        status, out = self.run_script("-i", "10.252.1.50 bar foo.local")
+        self.assertIn("Existing record match.", out)
+        self.assertEqual(self.server.puts, [])
+
+    def test_new_record_is_added(self):
+        status, out = self.run_script("-i", "10.252.1.50 bar bar.local")
+        self.assertEqual(status, 0)
+        self.assertIn("No existing record match.", out)
+        # One read of every network and one write, with no second read of NMN
+        self.assertEqual(self.server.gets, [SLS_NETWORKS])
+        self.assertEqual(self.server.puts, ["NMN"])
+        self.assertEqual(self.reservations("NMN")[-1],
+                         {"IPAddress": "10.252.1.50", "Name": "bar", "Aliases": ["bar.local"]})
+
+    def test_forced_update_outside_any_subnet_fails(self):
+        # foo matches the existing HMN record, but 10.99.1.10 isn't in any subnet
+        status, out = self.run_script("-i", "10.99.1.10 foo", "-f")
+        self.assertEqual(status, 1)
+        self.assertIn("Network or Subnet not found for 10.99.1.10.", out)
+        self.assertEqual(self.server.puts, [])
+
+    def test_export_reports_sls_http_error(self):
+        self.server.error = 500
+        status, out = self.run_script("--export=hosts")
+        self.assertEqual(status, 1)
+        self.assertIn("Error reading networks from SLS: 500 Internal Server Error", out)
+
+    def test_export_reports_bad_sls_data(self):
+        self.server.networks = {"detail": "not a list"}
+        status, out = self.run_script("--export=hosts")
+        self.assertEqual(status, 1)
+        self.assertIn("Error reading networks from SLS:", out)
+
+    def test_allocate_skips_dhcp_range(self):
+        subnet = self.server.networks[1]["ExtraProperties"]["Subnets"][0]
+        subnet.update({"DHCPStart": "10.252.0.1", "DHCPEnd": "10.252.0.9"})
+        status, out = self.run_script("--allocate=NMN/bootstrap_dhcp", "--count=2")
+        self.assertEqual(status, 0)
+        self.assertEqual(out.split(), ["10.252.0.10", "10.252.0.11"])
+
+    def test_allocate_reports_bad_dhcp_range(self):
+        subnet = self.server.networks[1]["ExtraProperties"]["Subnets"][0]
+        subnet.update({"DHCPStart": "10.252.0.1", "DHCPEnd": "bogus"})
+        status, out = self.run_script("--allocate=NMN/bootstrap_dhcp")
+        self.assertEqual(status, 1)
+        self.assertIn("Error: Invalid DHCP range in subnet bootstrap_dhcp: 10.252.0.1 - bogus", out)
+
+    def test_allocate_rejects_duplicate_names(self):
+        status, out = self.run_script("--allocate=NMN/bootstrap_dhcp", "bar", "baz bar")
+        self.assertEqual(status, 2)
+        self.assertIn("bar is given to --allocate more than once.", out)
+        self.assertEqual(self.server.puts, [])
+
+    def test_count_without_allocate_is_rejected(self):
+        status, out = self.run_script("-p", "--count=3")
+        self.assertEqual(status, 2)
+        self.assertIn("only used with --allocate", out)
+
+    def test_names_without_allocate_are_rejected(self):
+        # getopt stops at the first argument that isn't an option, so -f here
+        # would otherwise be silently dropped along with the stray name
+        status, out = self.run_script("-i", "10.252.1.50 bar", "baz", "-f")
+        self.assertEqual(status, 2)
+        self.assertIn("only used with --allocate", out)
+        self.assertEqual(self.server.puts, [])
+
+if __name__ == "__main__":
+    unittest.main()